@@ -10,6 +10,7 @@ import argparse
 import os
 import json
 import multiprocessing
+import multiprocessing.pool
 
 from lib.utils import timeit
 from lib.metric_manager import MetricManager
@@ -20,6 +21,26 @@ CONST_GROUP = 'repeat_group'
 CONST_ID = 'id'
 
 
+class NonDaemonProcess(multiprocessing.Process):
+    '''
+    Pool process that is allowed to start its own worker processes
+    '''
+
+    def _get_daemon(self):
+        return False
+
+    def _set_daemon(self, value):
+        pass
+    daemon = property(_get_daemon, _set_daemon)
+
+
+class NonDaemonPool(multiprocessing.pool.Pool):
+    '''
+    Process pool whose workers can run a pool of their own
+    '''
+    Process = NonDaemonProcess
+
+
 class Manager(object):
     '''
     Manages everything
@@ -36,7 +57,17 @@ class Manager(object):
 
         output_directory = os.path.abspath(args.d)
         total = self.load_experiments(output_directory)
-        self.run_analysis(total, args.t, args.a)
+        sender_set_options = {'max_tree_nodes': args.max_tree_nodes,
+                              'max_tree_time': args.max_tree_time,
+                              'max_tree_memory': args.max_tree_memory * 1024 * 1024,
+                              'estimator_samples': args.estimator_samples,
+                              'markov_chain': not args.tree_probabilities,
+                              'distance_matrix_max_nodes': args.distance_matrix_max_nodes,
+                              'sender_set_batch_size': args.sender_set_batch_size,
+                              'collusion': args.collusion,
+                              'bracket_trees': args.bracket_trees}
+        self.run_analysis(total, args.t, args.a,
+                          sender_set_options, args.include_partial)
         self.run_summations(output_directory, args.t)
         logging.info('Finished!!!')
 
@@ -61,7 +92,8 @@ class Manager(object):
         return total
 
     @timeit
-    def run_analysis(self, total, thread_count, should_archive):
+    def run_analysis(self, total, thread_count, should_archive,
+                     sender_set_options=None, include_partial=False):
         '''
         Run the post run analysis on a experiement
         '''
@@ -70,16 +102,29 @@ class Manager(object):
         nb_cores = thread_count
         if thread_count <= 0:
             nb_cores = multiprocessing.cpu_count()
-        logging.info('Running experiments on %d threads', nb_cores)
-        pool = multiprocessing.Pool(processes=nb_cores)
+        # cores left over when there are fewer experiments than cores are
+        # used to calculate the sender sets of each experiment in parallel
+        nb_experiments = max(min(nb_cores, total), 1)
+        sender_set_options = dict(sender_set_options or {})
+        sender_set_options['processes'] = max(nb_cores // nb_experiments, 1)
+        logging.info('Running experiments on %d threads, %d sender set threads each',
+                     nb_experiments, sender_set_options['processes'])
+        nb_cores = nb_experiments
+        if sender_set_options['processes'] > 1:
+            # experiment processes fork their own sender set workers
+            pool = NonDaemonPool(processes=nb_cores)
+        else:
+            pool = multiprocessing.Pool(processes=nb_cores)
 
         count = 1
         for exp_files in self._experiement_configurations:
             if nb_cores > 1:
                 pool.apply_async(_run_analysis, args=(
-                    exp_files, count, total, should_archive))
+                    exp_files, count, total, should_archive,
+                    sender_set_options, include_partial))
             else:
-                _run_analysis(exp_files, count, total, should_archive)
+                _run_analysis(exp_files, count, total, should_archive,
+                              sender_set_options, include_partial)
             count += 1
         pool.close()
         pool.join()
@@ -174,7 +219,8 @@ def _run_summations(exp_files, count, total):
 
 
 @timeit
-def _run_analysis(exp_files, count, total, should_archive):
+def _run_analysis(exp_files, count, total, should_archive,
+                  sender_set_options=None, include_partial=False):
     # set log level (can be lost if multiprocessing is used)
     logging.getLogger().setLevel(logging.INFO)
 
@@ -185,7 +231,8 @@ def _run_analysis(exp_files, count, total, should_archive):
     base_path = _get_base(exp_files[CONST_CONFIG])
 
     # calculate analysis metrics
-    metric_manager = MetricManager(base_path, count)
+    metric_manager = MetricManager(base_path, count, sender_set_options,
+                                   include_partial)
     metric_manager.analyze()
     metric_manager.save_data()
     if should_archive:
@@ -199,7 +246,28 @@ if __name__ == '__main__':
     PARSER.add_argument('-d', default='.', type=str,
                         help='Directory to store output in')
     PARSER.add_argument('-t', default='0', type=int,
-                        help='Number of threads to run. Default is the # of core CPUs available')
+                        help='Number of threads to run, shared between experiments and the '
+                        'sender set calculation. Default is the # of core CPUs available')
     PARSER.add_argument('-a', default=False, action='store_true',
                         help='Turn on experiment archiving')
+    PARSER.add_argument('--max-tree-nodes', default=0, type=int,
+                        help='Node budget of each routing tree. Default is unbounded')
+    PARSER.add_argument('--max-tree-time', default=0, type=float,
+                        help='Time budget in seconds of each routing tree. Default is unbounded')
+    PARSER.add_argument('--max-tree-memory', default=0, type=int,
+                        help='Memory budget in MB of each routing tree. Default is unbounded')
+    PARSER.add_argument('--estimator-samples', default=0, type=int,
+                        help='Simulated routes per sender to estimate the sender probabilities. Default is no estimate')
+    PARSER.add_argument('--tree-probabilities', default=False, action='store_true',
+                        help='Weight only the routing tree paths for the actual sender probabilities instead of the Markov chain of the routing choices')
+    PARSER.add_argument('--distance-matrix-max-nodes', default=0, type=int,
+                        help='Store the all pairs hop distances of graphs up to this many nodes next to the graph file and read the sender sets from them. Default is never')
+    PARSER.add_argument('--sender-set-batch-size', default=0, type=int,
+                        help='Search the sender sets of a whole file up front, this many at once. Default searches them on demand')
+    PARSER.add_argument('--collusion', default=False, action='store_true',
+                        help='Combine the observations of all adversaries on a routing path into one anonymity set')
+    PARSER.add_argument('--bracket-trees', default=False, action='store_true',
+                        help='Write the routing trees as bracket strings instead of the compact encoding')
+    PARSER.add_argument('--include-partial', default=False, action='store_true',
+                        help='Use the anonymity sets of routing trees that ran out of budget in the anonymity metrics, their sender probabilities come from the sender set instead of the routing paths')
     Manager().main(PARSER.parse_args())
@@ -6,7 +6,7 @@ Updated on Nov, 2017
 Calculate the send set for each captured route
 '''
 import numpy
-from lib.utils import percent
+from lib.utils import percent, anonymity_set_calculated
 from lib.actions.metric_base import MetricBase
 
 
@@ -15,11 +15,15 @@ class AnonymityAccuracyMetrics(MetricBase):
     Generic interface for JSON based actions
     '''
 
+    def __init__(self, include_partial=False):
+        super(AnonymityAccuracyMetrics, self).__init__()
+        self.include_partial = include_partial
+
     def process(self, data_object):
         data_object = super(AnonymityAccuracyMetrics,
                             self).process(data_object)
         # no anonymity set calculated
-        if 'anonymity_set' not in data_object or not data_object['anonymity_set']['calculated']:
+        if not anonymity_set_calculated(data_object, self.include_partial):
             return data_object
 
         self.add_column('entropy_missed')
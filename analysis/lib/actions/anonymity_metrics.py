@@ -7,6 +7,7 @@ Calculate the send set for each captured route
 '''
 import numpy
 from lib.utils import entropy, max_entropy, entropy_normalized, percent
+from lib.utils import anonymity_set_calculated
 from lib.actions.metric_base import MetricBase
 
 
@@ -15,15 +16,16 @@ class AnonymityMetrics(MetricBase):
     Generic interface for JSON based actions
     '''
 
-    def __init__(self, graph_manager, path_lengths):
+    def __init__(self, graph_manager, path_lengths, include_partial=False):
         super(AnonymityMetrics, self).__init__()
         self.graph_manager = graph_manager
         self.path_lengths = path_lengths
+        self.include_partial = include_partial
 
     def process(self, data_object):
         data_object = super(AnonymityMetrics, self).process(data_object)
         # no anonymity set calculated
-        if 'anonymity_set' not in data_object or not data_object['anonymity_set']['calculated']:
+        if not anonymity_set_calculated(data_object, self.include_partial):
             return data_object
 
         self.add_column('entropy')
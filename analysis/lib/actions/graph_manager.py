@@ -9,6 +9,8 @@ import networkx as nx
 import numpy
 from lib.utils import percent
 from lib.actions.metric_base import MetricBase
+from lib.routing.compact_graph import CompactGraph
+from lib.routing.distance_matrix import DistanceMatrix
 
 
 class GraphManager(MetricBase):
@@ -18,7 +20,8 @@ class GraphManager(MetricBase):
     def __init__(self):
         super(GraphManager, self).__init__()
         self.loaded_graphs = []
-        self.last_loaded_graph = {'cycle': None, 'graph': None}
+        self.last_loaded_graph = {'cycle': None, 'graph': None, 'compact': None,
+                                  'file_path': None, 'distances': None}
 
     def process(self, data_object):
         '''
@@ -91,11 +94,37 @@ class GraphManager(MetricBase):
         # get file path of the last entry (largest)
         graph = nx.read_gml(last_graph_file, 'id')
 
-        # cache graph
+        # cache graph and its compact snapshot
         self.last_loaded_graph['cycle'] = last_cycle
         self.last_loaded_graph['graph'] = graph
+        self.last_loaded_graph['compact'] = CompactGraph.from_nx_graph(graph)
+        self.last_loaded_graph['file_path'] = last_graph_file
+        self.last_loaded_graph['distances'] = None
         return graph
 
+    def get_compact_graph(self, cylce):
+        '''
+        Get the compact snapshot of the graph closest to the given cycle
+        :param cylce: experiment cycle
+        :return: CompactGraph
+        '''
+        self.get_graph(cylce)
+        return self.last_loaded_graph['compact']
+
+    def get_distance_matrix(self, cylce):
+        '''
+        Get the all pairs hop distances of the graph closest to the given cycle.
+        The distances are stored next to the graph file and reused by later runs.
+        :param cylce: experiment cycle
+        :return: DistanceMatrix
+        '''
+        self.get_graph(cylce)
+        if self.last_loaded_graph['distances'] is None:
+            self.last_loaded_graph['distances'] = DistanceMatrix.load_or_build(
+                self.last_loaded_graph['compact'],
+                self.last_loaded_graph['file_path'] + '.distances.npy')
+        return self.last_loaded_graph['distances']
+
     def create_summation(self):
         '''
         Create a list of summation metrics for this data set
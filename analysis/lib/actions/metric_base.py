@@ -6,10 +6,128 @@ Updated on Nov, 2017
 Framework for processing a files
 '''
 import math
+import numbers
+from collections import OrderedDict
+from itertools import izip_longest
 from StringIO import StringIO
 import pandas
 import numpy
 
+# rows are moved into the column buffers this many at a time
+ROW_CHUNK_SIZE = 1024
+
+# numpy types of the column kinds, a column holding several kinds is promoted
+_KIND_DTYPES = {'none': object, 'bool': numpy.bool_, 'int': numpy.int64,
+                'float': numpy.float64, 'object': object}
+# kind of each value type seen, looked up once per type
+_TYPE_KINDS = {type(None): 'none'}
+
+
+def _type_kind(value_type):
+    kind = _TYPE_KINDS.get(value_type)
+    if kind is None:
+        if issubclass(value_type, (bool, numpy.bool_)):
+            kind = 'bool'
+        elif issubclass(value_type, numbers.Integral):
+            kind = 'int'
+        elif issubclass(value_type, numbers.Real):
+            kind = 'float'
+        else:
+            kind = 'object'
+        _TYPE_KINDS[value_type] = kind
+    return kind
+
+
+def _promote_kind(kind, other):
+    # same promotions pandas makes inferring a column of row values
+    if kind is None or kind == other:
+        return other
+    kinds = frozenset([kind, other])
+    if kinds <= frozenset(['none', 'int', 'float']):
+        return 'float'
+    return 'object'
+
+
+def _concat_columns(existing, values):
+    '''
+    Join the values of a column to the values already in the data frame,
+    copied once into an array of the type pandas gives the concatenation
+    :param existing: ndarray of the values in the data frame
+    :param values: ndarray of the new values
+    :return: ndarray of all values
+    '''
+    dtypes = [existing.dtype, values.dtype]
+    kinds = set(dtype.kind for dtype in dtypes)
+    if 'O' in kinds or ('b' in kinds and len(kinds) > 1):
+        dtype = numpy.dtype(object)
+    else:
+        dtype = numpy.result_type(*dtypes)
+    column = numpy.empty(len(existing) + len(values), dtype=dtype)
+    column[:len(existing)] = existing
+    column[len(existing):] = values
+    return column
+
+
+class ColumnBuffer(object):
+    '''
+    Growable typed array of the values of one column. The type follows the
+    values like pandas infers it from rows: ints with missing values become
+    floats, bools with missing values and mixed types become objects.
+    '''
+
+    def __init__(self):
+        self._values = numpy.zeros(0, dtype=object)
+        self._kind = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def extend(self, values):
+        '''
+        Add values to the end of the column
+        :param values: sequence of values, None or NaN are missing values
+        '''
+        if len(values) == 0:
+            return
+        kind = None
+        for value_type in set(map(type, values)):
+            kind = _promote_kind(kind, _type_kind(value_type))
+        if kind == 'object' or kind == 'none':
+            chunk = numpy.empty(len(values), dtype=object)
+            chunk[:] = values
+        else:
+            # float conversion turns None into NaN
+            chunk = numpy.array(values, dtype=_KIND_DTYPES[kind])
+
+        kind = _promote_kind(self._kind, kind)
+        if kind != self._kind:
+            self._kind = kind
+            self._values = self._values.astype(_KIND_DTYPES[kind])
+        size = self._size + len(chunk)
+        if size > len(self._values):
+            # double the capacity, appends are amortized constant time
+            values = numpy.zeros(max(size, 2 * len(self._values)), dtype=self._values.dtype)
+            values[:self._size] = self._values[:self._size]
+            self._values = values
+        self._values[self._size:size] = chunk
+        self._size = size
+
+    def pad(self, size):
+        '''
+        Add empty values until the column has a number of values
+        :param size: Number of values of the column
+        '''
+        if self._size < size:
+            self.extend([numpy.nan] * (size - self._size))
+
+    def values(self):
+        '''
+        Get the values of the column
+        :return: ndarray view of the values
+        '''
+        return self._values[:self._size]
+
 
 class MetricBase(object):
     '''
@@ -19,7 +137,11 @@ class MetricBase(object):
     def __init__(self):
         self.data_frame = pandas.DataFrame()
         self._columns_to_add = []
+        # rows waiting to be moved into the column buffers
         self._rows_to_add = []
+        # one buffer per column position
+        self._buffers = []
+        self._buffered_rows = 0
         self._version = 1.0
 
     def process(self, data_object):
@@ -43,28 +165,35 @@ class MetricBase(object):
         '''
         End of processing a new file
         '''
+        self._flush_columns()
+
+    def _flush_columns(self):
         # create a data frame from the cached columns and rows
-        # first normalize the rows to match the column length
+        self._flush_rows()
+        if self._buffered_rows == 0 and not self._columns_to_add:
+            return
         columns = list(self.data_frame.columns) + self._columns_to_add
-        column_len = len(columns)
-        for row_index in range(len(self._rows_to_add)):
-            row = self._rows_to_add[row_index]
-            self._rows_to_add[row_index] = row + \
-                [numpy.nan] * (column_len - len(row))
-        # get existing data
-        existing_data = [list(row.values)
-                         for _, row in self.data_frame.iterrows()]
-        # normalize existing data
-        for row_index in range(len(existing_data)):
-            row = existing_data[row_index]
-            existing_data[row_index] = row + \
-                [numpy.nan] * (column_len - len(row))
-        # create Data frame
-        self.data_frame = pandas.DataFrame(
-            existing_data + self._rows_to_add, columns=columns)
+        data = OrderedDict()
+        for index, column_name in enumerate(columns):
+            if index < len(self._buffers):
+                buffer = self._buffers[index]
+            else:
+                buffer = ColumnBuffer()
+            # rows shorter than the columns are padded with empty values
+            buffer.pad(self._buffered_rows)
+            values = buffer.values()
+            if len(self.data_frame) > 0:
+                if column_name in self.data_frame.columns:
+                    existing = self.data_frame[column_name].values
+                else:
+                    existing = numpy.full(len(self.data_frame), numpy.nan)
+                values = _concat_columns(existing, values)
+            data[column_name] = values
+        self.data_frame = pandas.DataFrame(data, columns=columns)
         # clear cached data to add
         self._columns_to_add = []
-        self._rows_to_add = []
+        self._buffers = []
+        self._buffered_rows = 0
 
     def add_column(self, column_name):
         '''
@@ -90,19 +219,43 @@ class MetricBase(object):
             raise Exception('Unable to add a row longer than defined columns')
         # add the new row to the end of the data set
         self._rows_to_add.append(row_values)
+        if len(self._rows_to_add) >= ROW_CHUNK_SIZE:
+            self._flush_rows()
+
+    def _flush_rows(self):
+        # move the waiting rows into the column buffers, column by column
+        if not self._rows_to_add:
+            return
+        for index, values in enumerate(izip_longest(*self._rows_to_add,
+                                                    fillvalue=numpy.nan)):
+            if index == len(self._buffers):
+                buffer = ColumnBuffer()
+                buffer.pad(self._buffered_rows)
+                self._buffers.append(buffer)
+            self._buffers[index].extend(values)
+        self._buffered_rows += len(self._rows_to_add)
+        for buffer in self._buffers:
+            buffer.pad(self._buffered_rows)
+        self._rows_to_add = []
 
     def merge(self, other):
         '''
         Merge the data frame of this object with the data frame of another
         :param other: JSONAction
         '''
-        # check that the columns match
-        for column_name in other.data_frame.columns:
-            self.add_column(column_name)
-        # insert data from other into self
-        for _, row in other.data_frame.iterrows():
-            self.add_row(list(row.values))
-        # call on stop to merge data into the data frame
+        # rows still waiting to be added come before the other's rows
+        self._flush_columns()
+        # union of the columns, the other's new columns go last
+        columns = list(self.data_frame.columns)
+        columns += [name for name in other.data_frame.columns if name not in columns]
+        # frames without rows would turn every column into objects
+        frames = [frame for frame in (self.data_frame, other.data_frame) if len(frame) > 0]
+        data_frame = pandas.DataFrame()
+        if len(frames) > 0:
+            data_frame = pandas.concat(frames, ignore_index=True)
+        # a frame's rows are empty in the columns it does not have
+        self.data_frame = data_frame.reindex(columns=columns)
+        # call on stop to rebuild the data derived from the merged frame
         self.on_stop()
 
     def force_summation(self):
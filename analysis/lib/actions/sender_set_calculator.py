@@ -8,10 +8,31 @@ Calculate the send set for each captured route
 import os
 import json
 import logging
+import multiprocessing
+import zlib
+from collections import OrderedDict, namedtuple
+import numpy
 from lib.utils import distance, timeit
 from lib.routing.tree import RoutingTree
+from lib.routing.cache import LRUCache, RankCache, RankTableCache, SenderSetCache
 from lib.actions.metric_base import MetricBase
-from lib.routing.route_prediction import rank_greedy, rank_greedy_2_hop
+from lib.routing.route_prediction import rank_greedy_vectorized, RankGreedyKHop, rank_table
+from lib.routing.estimator import estimate_sender_distribution
+from lib.routing.markov import transition_matrix, sender_distribution_markov
+
+# routes intercepted after more hops are not calculated
+MAX_TREE_LENGTH = 12
+
+# calculator shared with the forked workers, set before the pool is created
+_WORKER_CALCULATOR = None
+
+# experiment constants of a file, read once so routes make no pandas lookups
+RouteContext = namedtuple('RouteContext', ['route_alg', 'look_ahead', 'randomness',
+                                           'rank_probabilities', 'rank_probability'])
+
+
+def _calculate_line(line):
+    return _WORKER_CALCULATOR._calculate_route(json.loads(line))
 
 
 class SenderSetCalculator(MetricBase):
@@ -19,13 +40,97 @@ class SenderSetCalculator(MetricBase):
     Generic interface for JSON based actions
     '''
 
-    def __init__(self, graph_manager, experiment_config, routing_choice):
+    def __init__(self, graph_manager, experiment_config, routing_choice,
+                 rank_cache_size=100000, max_tree_nodes=0, max_tree_time=0,
+                 max_tree_memory=0, sender_set_cache_size=1000000,
+                 anonymity_set_cache_size=10000, tree_cache_size=64, processes=1,
+                 chunk_size=16, rank_table_cache_size=64, estimator_samples=0,
+                 markov_chain=True, distance_matrix_max_nodes=0, sender_set_batch_size=0,
+                 collusion=False, bracket_trees=False):
+        """Constructor
+
+        Arguments:
+            graph_manager {GraphManager} -- Topology graphs of the experiment
+            experiment_config {ExperimentConfig} -- Experiment parameters
+            routing_choice {RoutingChoiceMetric} -- Measured routing choices
+
+        Keyword Arguments:
+            rank_cache_size {int} -- Maximum number of cached rankings (default: {100000})
+            max_tree_nodes {int} -- Node budget of each routing tree, 0 is
+            unbounded (default: {0})
+            max_tree_time {float} -- Seconds budget of each routing tree, 0 is
+            unbounded (default: {0})
+            max_tree_memory {int} -- Memory budget in bytes of each routing tree,
+            0 is unbounded (default: {0})
+            sender_set_cache_size {int} -- Maximum number of node ids held by the
+            cached sender sets (default: {1000000})
+            anonymity_set_cache_size {int} -- Maximum number of anonymity sets
+            reused by identical interceptions in a file (default: {10000})
+            tree_cache_size {int} -- Maximum number of routing trees kept to be
+            extended for later intercept hops, 0 builds every tree from scratch
+            (default: {64})
+            processes {int} -- Number of forked worker processes calculating the
+            routes of a file, 1 calculates them in this process (default: {1})
+            chunk_size {int} -- Number of consecutive routes sent to a worker at
+            once (default: {16})
+            rank_table_cache_size {int} -- Maximum number of targets whose rank
+            tables of the whole graph are kept, 0 ranks the neighbours of each
+            node on demand with the rank cache instead (default: {64})
+            estimator_samples {int} -- Number of simulated routes per sender used
+            to estimate probability_set_estimated, also for interceptions too deep
+            for a routing tree. 0 does not estimate (default: {0})
+            markov_chain {bool} -- Calculate probability_set_actual from the Markov
+            chain of the routing choices, over every route of the intercept hop
+            length. False weights only the routing paths of the routing tree.
+            (default: {True})
+            distance_matrix_max_nodes {int} -- Read the sender sets of graphs with
+            up to this many nodes from their all pairs distance matrix, stored
+            next to the graph file. 0 searches every sender set (default: {0})
+            sender_set_batch_size {int} -- Search the sender sets of all intercepted
+            routes of a file before processing it, this many at once. 0 searches
+            each sender set when it is first needed (default: {0})
+            collusion {bool} -- Combine the observations of every adversary on a
+            routing path. The first adversary's anonymity set is limited to the
+            nodes in the sender sets of all adversaries (default: {False})
+            bracket_trees {bool} -- Write the routing trees as bracket strings
+            under 'tree' instead of the compact encoding under 'tree_encoded',
+            see lib.routing.tree_encoding (default: {False})
+        """
         super(SenderSetCalculator, self).__init__()
         self.graph_manager = graph_manager
         self.experiment_config = experiment_config
         self.routing_choice = routing_choice
+        self.rank_cache_size = rank_cache_size
+        self.sender_set_cache_size = sender_set_cache_size
+        self.max_tree_nodes = max_tree_nodes
+        self.max_tree_time = max_tree_time
+        self.max_tree_memory = max_tree_memory
+        self._partial_count = 0
         self.output_file_path = ''
         self.output_file = None
+        self._rank_cache = None
+        self._sender_set_cache = None
+        self.rank_table_cache_size = rank_table_cache_size
+        self._rank_table_cache = None
+        self.estimator_samples = estimator_samples
+        self.markov_chain = markov_chain
+        self.distance_matrix_max_nodes = distance_matrix_max_nodes
+        self.sender_set_batch_size = sender_set_batch_size
+        self.collusion = collusion
+        self.bracket_trees = bracket_trees
+        self._transitions = LRUCache(64)
+        self._anonymity_sets = LRUCache(anonymity_set_cache_size)
+        self._anonymity_sets_graph = None
+        self.tree_cache_size = tree_cache_size
+        self._trees = LRUCache(max(tree_cache_size, 1))
+        self._tree_horizons = {}
+        self._look_ahead_rankers = {}
+        self._context = None
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self._pool = None
+        self._route_file = None
+        self._results = None
 
     def get_output_file_path(self):
         '''
@@ -44,15 +149,41 @@ class SenderSetCalculator(MetricBase):
         self.output_file_path = os.path.join(
             directory, 'sender_set.routing.json')
         self.output_file = open(self.output_file_path, 'w')
+        self._partial_count = 0
+        self._anonymity_sets.clear()
+        self._trees.clear()
+        self._tree_horizons.clear()
+        self._transitions.clear()
+        self._anonymity_sets_graph = None
+        self._context = self._create_context()
+        if self.sender_set_batch_size > 0:
+            self._prefetch_sender_sets(file_path)
+        if self.processes > 1:
+            self._start_workers(file_path)
 
     def on_stop(self):
         '''
         End of processing a new file
         '''
         super(SenderSetCalculator, self).on_stop()
+        self._stop_workers()
         if self.output_file is not None:
             self.output_file.close()
         self.output_file = None
+        if self._rank_cache is not None:
+            logging.info('Rank cache: %(hits)d hits, %(misses)d misses, %(size)d entries',
+                         self._rank_cache.stats())
+        if self._rank_table_cache is not None:
+            logging.info('Rank tables: %(hits)d hits, %(misses)d misses, %(size)d entries',
+                         self._rank_table_cache.stats())
+        if self._sender_set_cache is not None:
+            logging.info('Sender set cache: %(hits)d hits, %(misses)d misses, %(size)d entries',
+                         self._sender_set_cache.stats())
+        logging.info('Anonymity sets: %(hits)d reused, %(misses)d calculated',
+                     self._anonymity_sets.stats())
+        if self._partial_count > 0:
+            logging.info('%d routes have a partial anonymity set, their routing '
+                         'trees ran out of budget', self._partial_count)
 
     #@timeit
     def process(self, data_object):
@@ -62,73 +193,509 @@ class SenderSetCalculator(MetricBase):
         :return: Updated data_object reference
         '''
         super(SenderSetCalculator, self).process(data_object)
-        nx_graph = self.graph_manager.get_graph(data_object['cycle'])
+        if self._results is not None:
+            # workers calculate the routes in file order
+            route_id, route_distance, a_data = next(self._results)
+            if route_id != data_object['id']:
+                raise Exception('Sender set results are out of order: %s' %
+                                str(data_object['id']))
+        else:
+            route_id, route_distance, a_data = self._calculate_route(data_object)
+
+        data_object['distance'] = route_distance
+        if a_data is not None:
+            if a_data.get('partial', False):
+                self._partial_count += 1
+            data_object['anonymity_set'] = a_data
+
+        self.output_file.write(json.dumps(data_object))
+        self.output_file.write('\n')
+        return data_object
+
+    def _calculate_route(self, data_object):
+        '''
+        Calculate the source to destination distance and the anonymity set of a route
+        :param data_object: JSON object of the route
+        :return: tuple of route id, distance and anonymity set data, the anonymity
+            set is None if no adversary intercepted the route
+        '''
+        graph = self.graph_manager.get_compact_graph(data_object['cycle'])
 
         # calculate soure and destination difference
-        source_node = nx_graph.node[data_object['source_node']]
-        destination_node = nx_graph.node[data_object['destination_node']]
-        x_loc = source_node['location']
-        y_loc = destination_node['location']
-        data_object['distance'] = distance(x_loc, y_loc)
-
-        # calculate the anonymity set metrics
-        a_node, p_node = next(
-            iter(self._get_adversaries(data_object)), (None, None))
+        x_loc = graph.location(graph.node_index(data_object['source_node']))
+        y_loc = graph.location(graph.node_index(data_object['destination_node']))
+        route_distance = distance(x_loc, y_loc)
+
+        # calculate the anonymity set metrics, on the indices of the compact graph
+        adversaries = self._get_node_indices(graph, self._get_adversaries(data_object))
+        a_node, p_node = next(iter(adversaries), (None, None))
         if a_node is None:
             # no adversary node found in the path
-            self.output_file.write(json.dumps(data_object))
-            self.output_file.write('\n')
-            return data_object
+            return data_object['id'], route_distance, None
 
+        route_alg = self._context.route_alg
+        look_ahead = self._context.look_ahead
+
+        # rank calculations are shared by every route on the same graph
+        if self._rank_cache is None or self._rank_cache.graph is not graph or \
+                self._rank_cache.routing_algorithm is not route_alg:
+            self._rank_cache = RankCache(
+                graph, route_alg, self.rank_cache_size)
+        # targets are shared by every hop of a route, rank the whole graph at once
+        if self.rank_table_cache_size > 0 and (
+                self._rank_table_cache is None or self._rank_table_cache.graph is not graph or
+                self._rank_table_cache.look_ahead != look_ahead):
+            self._rank_table_cache = RankTableCache(
+                graph, look_ahead, self.rank_table_cache_size)
+        self._get_sender_set_cache(data_object['cycle'])
+
+        # identical interceptions in a file share the same anonymity set
+        if self._anonymity_sets_graph is not graph:
+            self._anonymity_sets.clear()
+            self._trees.clear()
+            self._transitions.clear()
+            self._anonymity_sets_graph = graph
+        a_data = self._get_interception(
+            graph, route_alg, a_node, p_node, data_object['target'])
+
+        # each route gets its own copy, later metrics read the route's fields
+        a_data = dict(a_data)
+        if self.collusion and len(adversaries) > 1:
+            a_data = self._limit_anonymity_set(
+                a_data, graph.to_node_ids(self._get_colluding_senders(adversaries)))
+            a_data['colluding'] = len(adversaries)
+        return data_object['id'], route_distance, a_data
+
+    def _create_context(self):
+        '''
+        Read the experiment constants of a file and resolve the ranking function
+        :return: RouteContext
+        '''
         # map routing type to ranking algorithm
         router_type = self.experiment_config.get_parameter('router_type')
-        look_ahead = self.experiment_config.get_parameter('look_ahead')
-        route_alg = None
+        look_ahead = int(self.experiment_config.get_parameter('look_ahead'))
         if router_type == 'DHTRouterGreedy':
-            if int(look_ahead) == 1:
-                route_alg = rank_greedy
-            elif int(look_ahead) == 2:
-                route_alg = rank_greedy_2_hop
+            if look_ahead == 1:
+                route_alg = rank_greedy_vectorized
+            elif look_ahead > 1:
+                # keep the ranker, it holds the look ahead tables of the graph
+                if look_ahead not in self._look_ahead_rankers:
+                    self._look_ahead_rankers[look_ahead] = RankGreedyKHop(look_ahead)
+                route_alg = self._look_ahead_rankers[look_ahead]
             else:
                 raise Exception('Unknown number of look ahead')
         else:
             raise Exception('Unknown routing type')
 
+        randomness = None
+        if self.estimator_samples > 0:
+            randomness = float(self.experiment_config.get_parameter('router_randomness'))
+        routing_choices = self.routing_choice.get_final_routing_choices()
+        probabilities = self._get_rank_probabilities(routing_choices)
+        rank_probability = self._get_rank_probability(
+            probabilities, routing_choices[len(probabilities) - 1])
+        return RouteContext(route_alg, look_ahead, randomness, probabilities,
+                            rank_probability)
+
+    def _get_colluding_senders(self, adversaries):
+        '''
+        Nodes in the sender set of every adversary on the path. Each sender set
+        holds the nodes within hop - 1 hops of the previous node, not passing
+        through the adversary, so it holds the sender as long as the message
+        did not pass that adversary before. Adversaries the path revisits are
+        only counted the first time.
+        :param adversaries: list of (adversary, previous node) tuples of the path
+        :return: sorted ndarray of node indices
+        '''
+        senders = None
+        seen = set()
+        for adversary, previous in adversaries:
+            adversary_id = int(adversary['id'])
+            if adversary_id in seen:
+                continue
+            seen.add(adversary_id)
+            nodes = self._sender_set_cache.get_sender_set(
+                adversary_id, int(previous['id']), int(adversary['hop']))
+            if senders is None:
+                senders = nodes
+            else:
+                senders = numpy.intersect1d(senders, nodes, assume_unique=True)
+        return senders
+
+    def _limit_anonymity_set(self, a_data, senders):
+        '''
+        Limit the sender sets and distributions of an anonymity set to the
+        possible senders, the distributions are normalized again. The routing
+        tree is left as it is.
+        :param a_data: dict of the anonymity set data
+        :param senders: list of the node ids that can be the sender
+        :return: dict of the anonymity set data
+        '''
+        senders = frozenset(senders)
+        if 'full_set' in a_data:
+            nodes = [i for i in a_data['full_set']['nodes'] if i in senders]
+            a_data['full_set'] = {'length': len(nodes), 'nodes': nodes}
+        if 'ranked_set' in a_data:
+            ranked_set = {}
+            for rank, nodes in a_data['ranked_set'].items():
+                nodes = [i for i in nodes if i in senders]
+                if nodes:
+                    ranked_set[rank] = nodes
+            a_data['ranked_set'] = ranked_set
+        for name in ['probability_set_top_rank', 'probability_set',
+                     'probability_set_sender_set', 'probability_set_actual',
+                     'probability_set_estimated']:
+            if name not in a_data:
+                continue
+            distro = dict((i, p) for i, p in a_data[name].items() if i in senders)
+            total = sum(distro.values())
+            if total > 0:
+                distro = dict((i, p / total) for i, p in distro.items())
+            a_data[name] = distro
+        return a_data
+
+    def _get_interception(self, graph, route_alg, a_node, p_node, target):
+        '''
+        Anonymity set of an adversary, shared by identical interceptions in a file
+        :param graph: Topology graph of the route's cycle
+        :param route_alg: Ranking function of the routing protocol
+        :param a_node: Adversary node of the routing path
+        :param p_node: Node that forwarded the message to the adversary
+        :param target: Address the message is routing to
+        :return: dict of the anonymity set data
+        '''
+        key = self._get_tree_key(a_node, p_node, target) + (int(a_node['hop']),)
+        a_data = self._anonymity_sets.get(key)
+        if a_data is None:
+            if self.tree_cache_size > 0:
+                a_data = self._extend_anonymity_sets(
+                    graph, route_alg, a_node, p_node, target)
+            else:
+                a_data = self._calculate_anonymity_set(
+                    graph, route_alg, a_node, p_node, target)
+                self._anonymity_sets.put(key, a_data)
+        if self.estimator_samples > 0 and 'probability_set_estimated' not in a_data:
+            # stored with the shared anonymity set, identical interceptions reuse it
+            a_data['probability_set_estimated'] = self._to_node_id_distribution(
+                graph, self._estimate_anonymity_set(graph, key))
+        return a_data
+
+    def _get_sender_set_cache(self, cycle):
+        '''
+        Sender set cache of the graph of a cycle
+        :param cycle: experiment cycle
+        :return: SenderSetCache
+        '''
+        graph = self.graph_manager.get_compact_graph(cycle)
+        # sender sets do not depend on the target, only on the graph
+        if self._sender_set_cache is None or self._sender_set_cache.graph is not graph:
+            self._sender_set_cache = SenderSetCache(
+                graph, self.sender_set_cache_size, self._get_distance_matrix(cycle))
+        return self._sender_set_cache
+
+    def _prefetch_sender_sets(self, file_path):
+        '''
+        Search the sender sets of every intercepted route of a file in batches,
+        each adversary and previous node pair up to the largest hop it was
+        intercepted at in the file. The largest hop of each routing tree is
+        kept as the horizon the tree is built with.
+        :param file_path: Full path to the file being processed
+        '''
+        max_hops = OrderedDict()
+        graph = None
+        with open(file_path, 'r') as route_file:
+            for line in route_file:
+                data_object = json.loads(line)
+                adversaries = self._get_adversaries(data_object)
+                if not adversaries:
+                    continue
+                # all graphs are static, the routes of other graphs are searched on demand
+                route_graph = self.graph_manager.get_compact_graph(data_object['cycle'])
+                if graph is None:
+                    graph = route_graph
+                    sender_set_cache = self._get_sender_set_cache(data_object['cycle'])
+                if route_graph is not graph:
+                    continue
+                if not self.collusion:
+                    # only the first adversary's sender set is used
+                    adversaries = adversaries[:1]
+                adversaries = self._get_node_indices(graph, adversaries)
+                a_node, p_node = adversaries[0]
+                tree_key = self._get_tree_key(a_node, p_node, data_object['target'])
+                self._tree_horizons[tree_key] = max(
+                    self._tree_horizons.get(tree_key, 0), int(a_node['hop']))
+                for a_node, p_node in adversaries:
+                    pair = (int(a_node['id']), int(p_node['id']))
+                    hop = int(a_node['hop'])
+                    if hop <= MAX_TREE_LENGTH:
+                        max_hops[pair] = max(max_hops.get(pair, 0), hop)
+        if graph is None:
+            return
+        interceptions = []
+        size = 0
+        for pair, hop in max_hops.items():
+            # only search what the cache can hold until it is used, each hop
+            # holds at most every node once plus its share of the frontiers
+            size += graph.number_of_nodes() * (hop + 1)
+            if self.sender_set_cache_size > 0 and size > self.sender_set_cache_size:
+                break
+            interceptions.append(pair + (hop,))
+        sender_set_cache.prefetch(interceptions, self.sender_set_batch_size)
+
+    def _start_workers(self, file_path):
+        '''
+        Fork the worker processes and queue every route of the file
+        :param file_path: Full path to the file being processed
+        '''
+        global _WORKER_CALCULATOR
+        # load the graph once, the forked workers share it
+        with open(file_path, 'r') as route_file:
+            first_line = route_file.readline()
+        if not first_line:
+            return
+        cycle = json.loads(first_line)['cycle']
+        self.graph_manager.get_compact_graph(cycle)
+        self._get_distance_matrix(cycle)
+
+        _WORKER_CALCULATOR = self
+        self._pool = multiprocessing.Pool(processes=self.processes)
+        _WORKER_CALCULATOR = None
+        self._route_file = open(file_path, 'r')
+        self._results = self._pool.imap(
+            _calculate_line, self._route_file, self.chunk_size)
+
+    def _stop_workers(self):
+        if self._pool is None:
+            return
+        self._pool.close()
+        self._pool.join()
+        self._route_file.close()
+        self._pool = None
+        self._route_file = None
+        self._results = None
+
+    def _get_tree_key(self, a_node, p_node, target):
+        return (int(a_node['id']), int(p_node['id']), float(target))
+
+    def _calculate_anonymity_set(self, graph, route_alg, a_node, p_node, target):
+        '''
+        Build the routing tree of an interception and calculate its anonymity set
+        :param graph: Topology graph of the route's cycle
+        :param route_alg: Ranking function of the routing protocol
+        :param a_node: Adversary node of the routing path
+        :param p_node: Node that forwarded the message to the adversary
+        :param target: Address the message is routing to
+        :return: dict of the anonymity set data
+        '''
         # calculate sender set and preferred routes
         # logging.info('Hop : %d', a_node['hop'])
-        r_tree = RoutingTree(nx_graph, route_alg, max_length=12)
+        r_tree = self._create_tree(graph, route_alg)
         if r_tree.build(a_node['id'], p_node['id'],
-                        a_node['hop'], data_object['target']):
+                        a_node['hop'], target):
+            return self._get_anonymity_set(r_tree, graph, target)
+        return {'calculated': False, 'hop': a_node['hop']}
 
-            a_data = {'calculated': True, 'hop': a_node['hop']}
-            a_data['tree'] = r_tree.to_bracket()
+    def _extend_anonymity_sets(self, graph, route_alg, a_node, p_node, target):
+        '''
+        Anonymity set of an interception from the routing tree kept for the
+        adversary, previous node and target. The tree's horizon is the deepest
+        hop the tree is intercepted at in the file if the file was prefetched,
+        the intercept hop otherwise. Deeper interceptions extend the tree up to
+        its horizon and build a new one past it. The anonymity sets of the hops
+        asked for are kept with the tree, shallower hops without one are built
+        on their own.
+        :param graph: Topology graph of the route's cycle
+        :param route_alg: Ranking function of the routing protocol
+        :param a_node: Adversary node of the routing path
+        :param p_node: Node that forwarded the message to the adversary
+        :param target: Address the message is routing to
+        :return: dict of the anonymity set data
+        '''
+        hop = int(a_node['hop'])
+        tree_key = self._get_tree_key(a_node, p_node, target)
+        if hop > MAX_TREE_LENGTH:
+            # longer than the maximum tree length
+            a_data = {'calculated': False, 'hop': a_node['hop']}
+            self._anonymity_sets.put(tree_key + (hop,), a_data)
+            return a_data
+
+        r_tree, tree_sets = self._trees.get(tree_key) or (None, {})
+        a_data = tree_sets.get(hop)
+        if a_data is None:
+            if r_tree is not None and r_tree.get_max_hop() <= hop <= r_tree.get_horizon():
+                while r_tree.get_max_hop() < hop:
+                    r_tree.extend()
+                a_data = self._get_anonymity_set(r_tree, graph, target)
+            elif r_tree is not None and hop < r_tree.get_max_hop():
+                a_data = self._calculate_anonymity_set(
+                    graph, route_alg, a_node, p_node, target)
+            else:
+                r_tree = self._create_tree(graph, route_alg)
+                r_tree.build(a_node['id'], p_node['id'], hop, target,
+                             horizon=max(hop, self._tree_horizons.get(tree_key, 0)))
+                a_data = self._get_anonymity_set(r_tree, graph, target)
+            tree_sets[hop] = a_data
+        self._trees.put(tree_key, (r_tree, tree_sets))
+        self._anonymity_sets.put(tree_key + (hop,), a_data)
+        return a_data
+
+    def _create_tree(self, graph, route_alg):
+        return RoutingTree(graph, route_alg, max_length=MAX_TREE_LENGTH,
+                           rank_cache=self._rank_cache,
+                           max_nodes=self.max_tree_nodes,
+                           max_time=self.max_tree_time,
+                           max_memory=self.max_tree_memory,
+                           sender_set_cache=self._sender_set_cache,
+                           rank_table_cache=self._rank_table_cache)
+
+    def _get_anonymity_set(self, r_tree, graph, target):
+        '''
+        Calculate the anonymity set of a built routing tree
+        :param r_tree: RoutingTree built to the intercept hop
+        :param graph: Topology graph the tree was built on
+        :param target: Address the message is routing to
+        :return: dict of the anonymity set data
+        '''
+        a_data = {'calculated': True, 'hop': r_tree.get_max_hop()}
+        partial = r_tree.is_partial()
+        if partial:
+            # routing paths are incomplete, record how far the build got
+            a_data['partial'] = True
+            a_data['explored'] = r_tree.get_build_stats()
+        # the output uses the node ids of the topology, not the compact indices
+        labels = graph.node_ids if graph.relabeled else None
+        if self.bracket_trees:
+            a_data['tree'] = r_tree.to_bracket(labels)
+        else:
+            a_data['tree_encoded'] = r_tree.to_encoded(labels)
+        a_set = r_tree.get_sender_set()
+        a_data['full_set'] = {'length': len(a_set), 'nodes': a_set}
+        a_data['probability_set_sender_set'] = r_tree.get_sender_set_distribution_full()
+        if partial:
+            # the deepest level of the paths is not the sender set, the sender
+            # set itself is complete and gives the distributions instead
+            a_data['ranked_set'] = {1: list(a_set)} if a_set else {}
+            a_data['probability_set_top_rank'] = a_data['probability_set_sender_set']
+            a_data['probability_set'] = a_data['probability_set_sender_set']
+        else:
             a_data['ranked_set'] = r_tree.get_sender_set_rank()
-            a_data['probability_set_top_rank'] = r_tree.get_sender_set_distribution_by_top_rank()
+            a_data['probability_set_top_rank'] = \
+                r_tree.get_sender_set_distribution_by_top_rank()
             a_data['probability_set'] = r_tree.get_sender_set_distribution(
                 r_tree.distro_rank_exponetial_backoff)
 
-            a_set = r_tree.get_sender_set()
-            a_data['full_set'] = {'length': len(a_set), 'nodes': a_set}
-            a_data['probability_set_sender_set'] = r_tree.get_sender_set_distribution_full()
+        # calculate the probability distribution using the actual routing choices
+        if self.markov_chain:
+            transitions = self._transitions.get(float(target))
+            if transitions is None:
+                transitions = transition_matrix(
+                    graph, self._get_rank_table(graph, target), self._context.rank_probability)
+                self._transitions.put(float(target), transitions)
+            a_data['probability_set_actual'] = sender_distribution_markov(
+                transitions, r_tree.get_data_at_level(0)[0],
+                r_tree.get_data_at_level(1)[0], r_tree.get_max_hop(), a_set)
+        elif partial:
+            a_data['probability_set_actual'] = a_data['probability_set_sender_set']
+        else:
+            a_data['probability_set_actual'] = r_tree.get_sender_set_distribution(
+                self._context.rank_probability)
+
+        if graph.relabeled:
+            a_data['ranked_set'] = dict(
+                (rank, graph.to_node_ids(nodes)) for rank, nodes in a_data['ranked_set'].items())
+            a_data['full_set']['nodes'] = graph.to_node_ids(a_set)
+            for name in ['probability_set_top_rank', 'probability_set',
+                         'probability_set_sender_set', 'probability_set_actual']:
+                a_data[name] = self._to_node_id_distribution(graph, a_data[name])
+        return a_data
 
-            # calculate the probability distribution using the actual routing choices
-            routing_choice_avg = self.routing_choice.get_final_routing_choices()
-            largest_rank = sorted(routing_choice_avg.keys())[-1]
+    def _to_node_id_distribution(self, graph, distribution):
+        '''
+        Key a sender distribution by the node ids of the topology
+        :param graph: CompactGraph the distribution was calculated on
+        :param distribution: dict of node index to probability
+        :return: dict of node id to probability
+        '''
+        if not graph.relabeled:
+            return distribution
+        nodes = list(distribution.keys())
+        return dict(zip(graph.to_node_ids(nodes), [distribution[i] for i in nodes]))
 
-            def _distro_rank(rank):
-                if rank > largest_rank or routing_choice_avg[rank] == 0.0:
-                    return (routing_choice_avg[largest_rank] / (2 * (rank - largest_rank))) / 100.0
-                return routing_choice_avg[rank] / 100.0
-            a_data['probability_set_actual'] = r_tree.get_sender_set_distribution(
-                _distro_rank)
-        else:
-            a_data = {'calculated': False, 'hop': a_node['hop']}
+    def _get_rank_probabilities(self, routing_choice_avg):
+        '''
+        Probability of the router choosing a neighbour of each measured rank
+        :param routing_choice_avg: dict of rank to the fraction of routing choices
+        :return: read only float ndarray indexed by rank, index 0 is unused
+        '''
+        largest_rank = max(routing_choice_avg.keys())
+        probabilities = numpy.zeros(largest_rank + 1, dtype=numpy.float64)
+        for rank in range(1, largest_rank + 1):
+            if routing_choice_avg[rank] != 0.0:
+                probabilities[rank] = routing_choice_avg[rank] / 100.0
+            elif rank < largest_rank:
+                # unused ranks fall back to the backoff of the largest rank
+                probabilities[rank] = (routing_choice_avg[largest_rank] /
+                                       (2 * (rank - largest_rank))) / 100.0
+        probabilities.flags.writeable = False
+        return probabilities
 
-        data_object['anonymity_set'] = a_data
+    def _get_rank_probability(self, probabilities, largest_choice):
+        '''
+        Probability of the router choosing a neighbour of a rank
+        :param probabilities: ndarray of the measured ranks, see _get_rank_probabilities
+        :param largest_choice: fraction of routing choices of the largest measured rank
+        :return: function of rank to probability
+        '''
+        largest_rank = len(probabilities) - 1
+        # called for every edge of a tree, plain list lookups are cheaper
+        measured = probabilities.tolist()
 
-        self.output_file.write(json.dumps(data_object))
-        self.output_file.write('\n')
-        return data_object
+        def _distro_rank(rank):
+            if rank > largest_rank:
+                return (largest_choice / (2 * (rank - largest_rank))) / 100.0
+            return measured[rank]
+        return _distro_rank
+
+    def _get_distance_matrix(self, cycle):
+        graph = self.graph_manager.get_compact_graph(cycle)
+        if graph.number_of_nodes() > self.distance_matrix_max_nodes:
+            return None
+        return self.graph_manager.get_distance_matrix(cycle)
+
+    def _get_rank_table(self, graph, target):
+        if self._rank_table_cache is not None:
+            return self._rank_table_cache.get_rank_table(target)
+        return rank_table(graph, target, self._context.look_ahead)
+
+    def _estimate_anonymity_set(self, graph, key):
+        '''
+        Estimate the sender probabilities of an interception by simulating routes
+        :param graph: Topology graph of the route's cycle
+        :param key: tuple of the adversary id, previous node id, target and hop
+        :return: dict of node id to estimated probability
+        '''
+        adversary_id, previous_id, target, hop = key
+        ranks = self._get_rank_table(graph, target)
+        sender_nodes = self._sender_set_cache.get_sender_set(
+            adversary_id, previous_id, hop)
+        # seeded by the interception, estimates do not depend on the worker count
+        random_state = numpy.random.RandomState(zlib.crc32(repr(key)) & 0xffffffff)
+        return estimate_sender_distribution(
+            graph, ranks, adversary_id, previous_id, hop, sender_nodes, self._context.randomness,
+            self.estimator_samples, random_state)
+
+    def _get_node_indices(self, graph, adversaries):
+        '''
+        Adversaries of a path with the node ids replaced by the graph's indices
+        :param graph: CompactGraph of the route's cycle
+        :param adversaries: list of (adversary, previous node) tuples
+        :return: list of (adversary, previous node) tuples
+        '''
+        if not graph.relabeled:
+            return adversaries
+        return [(dict(adversary, id=graph.node_index(int(adversary['id']))),
+                 dict(previous, id=graph.node_index(int(previous['id']))))
+                for adversary, previous in adversaries]
 
     def _get_adversaries(self, data_obj):
         adversaries = []
@@ -6,7 +6,7 @@ Updated on Nov, 2017
 Calculate the send set for each captured route
 '''
 import numpy
-from lib.utils import percent
+from lib.utils import percent, anonymity_set_calculated
 from lib.actions.metric_base import MetricBase
 
 
@@ -15,9 +15,10 @@ class SenderSetSize(MetricBase):
     Generic interface for JSON based actions
     '''
 
-    def __init__(self, path_metrics):
+    def __init__(self, path_metrics, include_partial=False):
         super(SenderSetSize, self).__init__()
         self.path_metrics = path_metrics
+        self.include_partial = include_partial
 
     def process(self, data_object):
         '''
@@ -34,7 +35,7 @@ class SenderSetSize(MetricBase):
             return data_object
 
         set_size = numpy.nan
-        if data_object['anonymity_set']['calculated']:
+        if anonymity_set_calculated(data_object, self.include_partial):
             set_size = int(data_object['anonymity_set']['full_set']['length'])
         intercept_hop = int(data_object['anonymity_set']['hop'])
 
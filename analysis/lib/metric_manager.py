@@ -38,7 +38,20 @@ class MetricManager(object):
     Manage all of the analysis metrics for a given experiment
     '''
 
-    def __init__(self, base_directory, experiment_id=''):
+    def __init__(self, base_directory, experiment_id='', sender_set_options=None,
+                 include_partial=False):
+        """Constructor
+
+        Arguments:
+            base_directory {str} -- Experiment directory or path to a metric file
+
+        Keyword Arguments:
+            experiment_id {str} -- ID used in log messages (default: {''})
+            sender_set_options {dict} -- Keyword arguments for the sender set
+            calculator, e.g. routing tree budgets (default: {None})
+            include_partial {bool} -- Use anonymity sets of routing trees that ran
+            out of budget in the anonymity metrics (default: {False})
+        """
         base_directory = os.path.abspath(base_directory)
         if not os.path.exists(base_directory):
             raise Exception('Unable to find the directory: %s' %
@@ -46,6 +59,8 @@ class MetricManager(object):
 
         self.is_dirty = False
         self.experiment_id = str(experiment_id)
+        self.sender_set_options = sender_set_options or {}
+        self.include_partial = include_partial
 
         # can pass either full file path or directory path
         if os.path.isdir(base_directory):
@@ -228,13 +243,14 @@ class MetricManager(object):
 
         path_lengths = PathLengthsMetric()
         sender_set_calc = SenderSetCalculator(
-            graph_manager, exp_config, routing_choice)
-        sender_set_size = SenderSetSize(path_lengths)
+            graph_manager, exp_config, routing_choice, **self.sender_set_options)
+        sender_set_size = SenderSetSize(path_lengths, self.include_partial)
         intercept_hop = AdversaryInterceptHop(sender_set_size)
         intercept_hop_calced = AdversaryInterceptHopCalculated(sender_set_size)
         sender_set_size_inter = SenderSetSizeInterceptHop(sender_set_size)
 
-        anon_metrics = AnonymityMetrics(graph_manager, path_lengths)
+        anon_metrics = AnonymityMetrics(
+            graph_manager, path_lengths, self.include_partial)
 
         anon_entropy = AnonymityEntropy(anon_metrics, 'entropy', 'Entropy')
         anon_entropy_norm = AnonymityEntropy(
@@ -273,7 +289,7 @@ class MetricManager(object):
 
         top_ranked_set_avg = AnonymityTopRankedSetSize(anon_metrics)
 
-        anon_accuracy_metrics = AnonymityAccuracyMetrics()
+        anon_accuracy_metrics = AnonymityAccuracyMetrics(self.include_partial)
         anon_hit_hop = AnonymityHitAtHop(anon_accuracy_metrics)
         anon_rank_hit = AnonymityTopRankAccuracyByRank(anon_accuracy_metrics)
 
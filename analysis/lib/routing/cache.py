@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+'''
+Updated on March, 2018
+@author: Todd Baumeister <tbaumeist@gmail.com>
+
+Bounded caches shared between routing tree calculations
+'''
+from collections import OrderedDict
+import numpy
+from scipy import sparse
+from lib.routing.compact_graph import CompactGraph, gather_neighbors
+from lib.routing.route_prediction import first_choice_senders, rank_table
+
+
+class LRUCache(object):
+    '''
+    Least recently used cache with hit and miss counters
+    '''
+
+    def __init__(self, max_size=0, sizeof=None):
+        """Constructor
+
+        Keyword Arguments:
+            max_size {int} -- Maximum total size of the entries, 0 is unbounded (default: {0})
+            sizeof {function} -- Size of a cached value, each entry has size 1
+            if not set (default: {None})
+        """
+        self._entries = OrderedDict()
+        self._max_size = max_size
+        self._sizeof = sizeof
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        '''
+        Look up a cached value and mark it as recently used
+        :param key: cache key
+        :return: cached value or None if not found
+        '''
+        value = self._entries.pop(key, None)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries[key] = value
+        return value
+
+    def put(self, key, value):
+        '''
+        Store a value, evicting the least recently used entry when full
+        :param key: cache key
+        :param value: value to store, can not be None
+        '''
+        old_value = self._entries.pop(key, None)
+        if old_value is not None:
+            self._size -= self._get_size(old_value)
+        self._entries[key] = value
+        self._size += self._get_size(value)
+        # the new entry is kept even if it is larger than the cache
+        while self._max_size > 0 and self._size > self._max_size and \
+                len(self._entries) > 1:
+            _, old_value = self._entries.popitem(last=False)
+            self._size -= self._get_size(old_value)
+
+    def clear(self):
+        '''
+        Remove all entries and reset the counters
+        '''
+        self._entries.clear()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        '''
+        Cache usage counters
+        :return: dict of hits, misses and current size
+        '''
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+    def _get_size(self, value):
+        if self._sizeof is None:
+            return 1
+        return self._sizeof(value)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RankCache(LRUCache):
+    '''
+    Caches the neighbour ranks of a node routing towards a target address.
+    Entries are a reverse index of neighbour id to rank (starting at 1).
+    '''
+
+    def __init__(self, graph, routing_algorithm, max_size=0):
+        """Constructor
+
+        Arguments:
+            graph {Graph} -- Topology graph the ranks are calculated on
+            routing_algorithm {function} -- Ranking function used by the protocol
+
+        Keyword Arguments:
+            max_size {int} -- Maximum number of entries, 0 is unbounded (default: {0})
+        """
+        super(RankCache, self).__init__(max_size)
+        self.graph = graph
+        self.routing_algorithm = routing_algorithm
+
+    def get_ranks(self, node_id, target_address):
+        '''
+        Get the rank of every neighbour of a node
+        :param node_id: ID of the node making the routing choice
+        :param target_address: Address the message is routed to
+        :return: dict of neighbour id to rank
+        '''
+        key = (node_id, target_address)
+        ranks = self.get(key)
+        if ranks is None:
+            ranked_nodes = self.routing_algorithm(
+                node_id, target_address, self.graph)
+            ranks = {}
+            for index, nodes in enumerate(ranked_nodes):
+                for neighbor_id in nodes:
+                    ranks[neighbor_id] = index + 1
+            self.put(key, ranks)
+        return ranks
+
+
+class RankTableCache(LRUCache):
+    '''
+    Caches the neighbour ranks of every node of a graph routing towards a
+    target address. Entries hold the read only rank array aligned with the CSR
+    edges of the graph, see lib.routing.route_prediction.rank_table, and the
+    first choice senders of every node derived from it.
+    '''
+
+    def __init__(self, graph, look_ahead=1, max_size=0):
+        """Constructor
+
+        Arguments:
+            graph {CompactGraph} -- Topology snapshot the ranks are calculated on
+
+        Keyword Arguments:
+            look_ahead {int} -- Number of hops the greedy router looks ahead (default: {1})
+            max_size {int} -- Maximum number of entries, 0 is unbounded (default: {0})
+        """
+        super(RankTableCache, self).__init__(max_size)
+        self.graph = graph
+        self.look_ahead = look_ahead
+
+    def get_rank_table(self, target_address):
+        '''
+        Get the rank of every neighbour of every node
+        :param target_address: Address the message is routed to
+        :return: read only int32 ndarray, the rank of indices[e] as seen by sources[e]
+        '''
+        return self._get_entry(target_address)[0]
+
+    def get_first_choice_senders(self, target_address):
+        '''
+        Get the nodes routing to each node as their first choice
+        :param target_address: Address the message is routed to
+        :return: tuple of read only (offsets, senders) ndarrays, the senders of
+            node i are senders[offsets[i]:offsets[i + 1]]
+        '''
+        return self._get_entry(target_address)[1:]
+
+    def _get_entry(self, target_address):
+        entry = self.get(target_address)
+        if entry is None:
+            ranks = rank_table(self.graph, target_address, self.look_ahead)
+            offsets, senders = first_choice_senders(self.graph, ranks)
+            for values in (ranks, offsets, senders):
+                values.flags.writeable = False
+            entry = (ranks, offsets, senders)
+            self.put(target_address, entry)
+        return entry
+
+
+class SenderSetCache(LRUCache):
+    '''
+    Caches the sender set of an adversary and previous node pair for a hop count.
+    Entries hold the sorted node ids and the last BFS frontier, so hop h is
+    extended from hop h-1. The cache size counts the node ids held by the
+    entries. With a distance matrix the sender sets of every hop are read from
+    the distances of the pair instead.
+    '''
+
+    def __init__(self, graph, max_size=0, distances=None):
+        """Constructor
+
+        Arguments:
+            graph {Graph} -- Topology graph, networkx Graph or CompactGraph
+
+        Keyword Arguments:
+            max_size {int} -- Maximum number of node ids held by the entries, 0 is
+            unbounded (default: {0})
+            distances {DistanceMatrix} -- All pairs distances of the graph, the
+            graph must be the CompactGraph they were built on (default: {None})
+        """
+        super(SenderSetCache, self).__init__(
+            max_size, lambda entry: len(entry[0]) + len(entry[1]))
+        self.graph = graph
+        self.distances = distances
+        self._pair_distances = LRUCache(max_size, len)
+
+    def get_sender_set(self, adversary_id, previous_id, hop):
+        '''
+        Get the nodes within hop - 1 hops of the previous node, not passing
+        through the adversary
+        :param adversary_id: ID of the adversary node
+        :param previous_id: ID of the node that forwarded to the adversary
+        :param hop: Hop count the message was intercepted at
+        :return: sorted read only ndarray of the node ids
+        '''
+        return self._get_entry(adversary_id, previous_id, hop)[0]
+
+    def prefetch(self, interceptions, batch_size=64):
+        '''
+        Calculate the sender sets of many adversary and previous node pairs at
+        once, each pair for hops 1 to the largest hop it was intercepted at.
+        The frontiers of batch_size pairs advance together as the columns of a
+        sparse boolean matrix, which also bounds the memory used by a batch.
+        Pairs of a similar hop count are searched together. Only used for
+        CompactGraphs without a distance matrix, the other sender sets are
+        calculated on demand.
+        :param interceptions: list of (adversary id, previous node id, hop) tuples
+        :param batch_size: Number of pairs searched together
+        '''
+        if self.distances is not None or not isinstance(self.graph, CompactGraph):
+            return
+        max_hops = OrderedDict()
+        for adversary_id, previous_id, hop in interceptions:
+            pair = (adversary_id, previous_id)
+            max_hops[pair] = max(max_hops.get(pair, 0), hop)
+        pairs = sorted([(hop, pair) for pair, hop in max_hops.items()
+                        if (pair + (hop,)) not in self._entries], key=lambda x: x[0])
+        size = self.graph.number_of_nodes()
+        adjacency = sparse.csr_matrix(
+            (numpy.ones(len(self.graph.indices), dtype=bool), self.graph.indices,
+             self.graph.offsets), shape=(size, size))
+        for start in range(0, len(pairs), batch_size):
+            batch = [i[1] for i in pairs[start:start + batch_size]]
+            batch_hops = [i[0] for i in pairs[start:start + batch_size]]
+            columns = numpy.arange(len(batch))
+            adversaries = sparse.csc_matrix(
+                (numpy.ones(len(batch), dtype=bool), ([i[0] for i in batch], columns)),
+                shape=(size, len(batch)))
+            frontier = sparse.csc_matrix(
+                (numpy.ones(len(batch), dtype=bool), ([i[1] for i in batch], columns)),
+                shape=(size, len(batch)))
+            reached = frontier
+            for hop in range(1, batch_hops[-1] + 1):
+                if hop > 1:
+                    # one hop further, leaving out known nodes and the adversary
+                    frontier = (adjacency.dot(frontier) > reached) > adversaries
+                    reached = reached + frontier
+                self._put_columns(batch, batch_hops, hop, sparse.csc_matrix(reached),
+                                  sparse.csc_matrix(frontier))
+
+    def _put_columns(self, pairs, max_hops, hop, reached, frontier):
+        reached.sort_indices()
+        frontier.sort_indices()
+        for column, (adversary_id, previous_id) in enumerate(pairs):
+            if hop > max_hops[column]:
+                continue
+            nodes = reached.indices[
+                reached.indptr[column]:reached.indptr[column + 1]].astype(numpy.int32)
+            last_nodes = frontier.indices[
+                frontier.indptr[column]:frontier.indptr[column + 1]].astype(numpy.int32)
+            nodes.flags.writeable = False
+            last_nodes.flags.writeable = False
+            self.put((adversary_id, previous_id, hop), (nodes, last_nodes))
+
+    def _get_entry(self, adversary_id, previous_id, hop):
+        key = (adversary_id, previous_id, hop)
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+
+        if hop < 1:
+            nodes = numpy.array([], dtype=numpy.int32)
+            frontier = nodes
+        elif self.distances is not None:
+            pair_distances = self._pair_distances.get((adversary_id, previous_id))
+            if pair_distances is None:
+                pair_distances = self.distances.avoiding_distances(
+                    self.graph, adversary_id, previous_id)
+                self._pair_distances.put((adversary_id, previous_id), pair_distances)
+            nodes = numpy.flatnonzero(pair_distances <= hop - 1).astype(numpy.int32)
+            frontier = numpy.flatnonzero(pair_distances == hop - 1).astype(numpy.int32)
+        elif hop == 1:
+            nodes = numpy.array([previous_id], dtype=numpy.int32)
+            frontier = nodes
+        else:
+            # extend the frontier of the previous hop count by one hop
+            last_nodes, last_frontier = self._get_entry(
+                adversary_id, previous_id, hop - 1)
+            frontier = numpy.unique(gather_neighbors(self.graph, last_frontier))
+            frontier = numpy.setdiff1d(frontier, last_nodes, assume_unique=True)
+            frontier = frontier[frontier != adversary_id]
+            nodes = numpy.union1d(last_nodes, frontier).astype(numpy.int32)
+        nodes.flags.writeable = False
+        frontier.flags.writeable = False
+        entry = (nodes, frontier)
+        self.put(key, entry)
+        return entry
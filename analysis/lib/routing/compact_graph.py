@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+'''
+Updated on March, 2018
+@author: Todd Baumeister <tbaumeist@gmail.com>
+
+Compact, immutable snapshot of a topology graph
+'''
+import numpy
+
+
+class CompactGraph(object):
+    '''
+    Compressed sparse row (CSR) representation of an undirected topology.
+    Nodes are numbered 0 to n-1, the methods take and return these indices.
+    node_ids[i] is the node id of index i in the original graph, see
+    node_index and to_node_ids to translate between them.
+    Neighbours of node i are indices[offsets[i]:offsets[i + 1]], in the same
+    order networkx iterates them, and locations[i] is the DHT address of node i.
+    Edge e runs from sources[e] to indices[e], reverse_edges[e] is the index
+    of the same edge in the opposite direction.
+    '''
+
+    def __init__(self, offsets, indices, locations, node_ids=None):
+        """Constructor
+
+        Arguments:
+            offsets {ndarray} -- Start offset of each node's neighbours, length n + 1
+            indices {ndarray} -- Concatenated neighbour indices
+            locations {ndarray} -- Location of each node
+
+        Keyword Arguments:
+            node_ids {ndarray} -- Node id of each index, the index itself if
+            not set (default: {None})
+        """
+        if len(offsets) != len(locations) + 1:
+            raise Exception('Offsets and locations do not describe the same nodes')
+        self._offsets = numpy.array(offsets, dtype=numpy.int64)
+        self._indices = numpy.array(indices, dtype=numpy.int32)
+        self._locations = numpy.array(locations, dtype=numpy.float64)
+        if node_ids is None:
+            node_ids = numpy.arange(len(self._locations))
+        self._node_ids = numpy.array(node_ids, dtype=numpy.int64)
+        if len(self._node_ids) != len(self._locations):
+            raise Exception('Node ids and locations do not describe the same nodes')
+        self._relabeled = bool((self._node_ids != numpy.arange(len(self._node_ids))).any())
+        self._node_indices = None
+        if self._relabeled:
+            self._node_indices = dict(
+                (node_id, index) for index, node_id in enumerate(self._node_ids.tolist()))
+            if len(self._node_indices) != len(self._node_ids):
+                raise Exception('Node ids must be unique')
+        self._sources = numpy.repeat(
+            numpy.arange(len(self._locations), dtype=numpy.int32),
+            numpy.diff(self._offsets))
+        # both directions of every edge sort to the same position
+        self._reverse_edges = numpy.empty(len(self._indices), dtype=numpy.int64)
+        self._reverse_edges[numpy.lexsort((self._sources, self._indices))] = \
+            numpy.lexsort((self._indices, self._sources))
+        if len(self._indices) > 0 and \
+                (self._indices[self._reverse_edges] != self._sources).any():
+            raise Exception('Compact graphs require undirected edges')
+        for array in (self._offsets, self._indices, self._locations, self._node_ids,
+                      self._sources, self._reverse_edges):
+            array.flags.writeable = False
+
+    @staticmethod
+    def from_nx_graph(nx_graph):
+        """Build a snapshot from a networkx graph
+
+        Arguments:
+            nx_graph {Graph} -- Topology graph with integer node ids, nodes must
+            carry a 'location' attribute. Sorted node ids are mapped to indices
+            0 to n-1.
+
+        Returns:
+            CompactGraph -- Snapshot of the graph
+        """
+        nodes = sorted(nx_graph.nodes())
+        node_indices = dict((node_id, index) for index, node_id in enumerate(nodes))
+
+        offsets = [0]
+        indices = []
+        locations = []
+        for node_id in nodes:
+            indices.extend(node_indices[i] for i in nx_graph.neighbors(node_id))
+            offsets.append(len(indices))
+            locations.append(nx_graph.node[node_id]['location'])
+        return CompactGraph(offsets, indices, locations, nodes)
+
+    @property
+    def offsets(self):
+        ''' Read only CSR offsets array '''
+        return self._offsets
+
+    @property
+    def indices(self):
+        ''' Read only CSR neighbour array '''
+        return self._indices
+
+    @property
+    def sources(self):
+        ''' Read only source node id of every CSR edge '''
+        return self._sources
+
+    @property
+    def reverse_edges(self):
+        ''' Read only index of the opposite direction of every CSR edge '''
+        return self._reverse_edges
+
+    @property
+    def node_ids(self):
+        ''' Read only node id of every index '''
+        return self._node_ids
+
+    @property
+    def relabeled(self):
+        ''' True if the node ids are not the indices 0 to n-1 '''
+        return self._relabeled
+
+    def node_index(self, node_id):
+        '''
+        Index of a node of the original graph
+        :param node_id: ID of the node
+        :return: int index
+        '''
+        if self._node_indices is None:
+            if not 0 <= node_id < len(self._node_ids):
+                raise Exception('Unknown node id: %s' % str(node_id))
+            return int(node_id)
+        index = self._node_indices.get(node_id)
+        if index is None:
+            raise Exception('Unknown node id: %s' % str(node_id))
+        return index
+
+    def to_node_ids(self, indices):
+        '''
+        Node ids of the original graph
+        :param indices: list or ndarray of node indices
+        :return: list of node ids
+        '''
+        if not self._relabeled:
+            return [int(i) for i in indices]
+        return self._node_ids[numpy.asarray(indices, dtype=numpy.int64)].tolist()
+
+    @property
+    def locations(self):
+        ''' Read only node location array '''
+        return self._locations
+
+    def number_of_nodes(self):
+        '''
+        Number of nodes in the graph
+        :return: int node count
+        '''
+        return len(self._locations)
+
+    def number_of_edges(self):
+        '''
+        Number of undirected edges in the graph
+        :return: int edge count
+        '''
+        return len(self._indices) // 2
+
+    def degree(self, node_id):
+        '''
+        Degree of a node
+        :param node_id: ID of the node
+        :return: int number of neighbours
+        '''
+        return int(self._offsets[node_id + 1] - self._offsets[node_id])
+
+    def neighbor_array(self, node_id):
+        '''
+        Neighbours of a node as a read only array view
+        :param node_id: ID of the node
+        :return: ndarray of neighbour ids
+        '''
+        return self._indices[self._offsets[node_id]:self._offsets[node_id + 1]]
+
+    def neighbors(self, node_id):
+        '''
+        Neighbours of a node, same contract as networkx Graph.neighbors
+        :param node_id: ID of the node
+        :return: list of neighbour ids
+        '''
+        return self.neighbor_array(node_id).tolist()
+
+    def gather_neighbors(self, node_ids):
+        '''
+        Neighbours of several nodes in one array
+        :param node_ids: ndarray of node ids
+        :return: ndarray of the concatenated neighbour ids, may contain duplicates
+        '''
+        starts = self._offsets[node_ids]
+        lengths = self._offsets[node_ids + 1] - starts
+        # position of every gathered neighbour in the CSR index array
+        shift = numpy.repeat(starts - numpy.cumsum(lengths) + lengths, lengths)
+        return self._indices[shift + numpy.arange(lengths.sum())]
+
+    def location(self, node_id):
+        '''
+        Location of a node
+        :param node_id: ID of the node
+        :return: float location
+        '''
+        return float(self._locations[node_id])
+
+
+def neighbor_locations(graph, node_id):
+    '''
+    List the neighbours of a node together with their locations
+    :param graph: networkx Graph or CompactGraph
+    :param node_id: ID of the node
+    :return: list of (neighbour id, location) tuples
+    '''
+    if isinstance(graph, CompactGraph):
+        neighbors = graph.neighbor_array(node_id)
+        return zip(neighbors.tolist(), graph.locations[neighbors].tolist())
+    return [(child_id, graph.node[child_id]['location'])
+            for child_id in graph.neighbors(node_id)]
+
+
+def gather_neighbors(graph, node_ids):
+    '''
+    Neighbours of several nodes in either graph representation
+    :param graph: networkx Graph or CompactGraph
+    :param node_ids: ndarray of node ids
+    :return: ndarray of the concatenated neighbour ids, may contain duplicates
+    '''
+    if isinstance(graph, CompactGraph):
+        return graph.gather_neighbors(node_ids)
+    neighbors = []
+    for node_id in node_ids.tolist():
+        neighbors.extend(graph.neighbors(node_id))
+    return numpy.array(neighbors, dtype=numpy.int32)
+
+
+def node_location(graph, node_id):
+    '''
+    Location of a node in either graph representation
+    :param graph: networkx Graph or CompactGraph
+    :param node_id: ID of the node
+    :return: float location
+    '''
+    if isinstance(graph, CompactGraph):
+        return graph.location(node_id)
+    return graph.node[node_id]['location']
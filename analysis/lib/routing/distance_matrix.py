@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+'''
+Updated on March, 2018
+@author: Todd Baumeister <tbaumeist@gmail.com>
+
+All pairs hop distances of a topology graph
+'''
+import os
+import numpy
+from scipy import sparse
+
+# distance of nodes that can not be reached, uint8 saturates here
+UNREACHABLE = 255
+
+
+class DistanceMatrix(object):
+    '''
+    Hop distance between every pair of nodes of a CompactGraph, stored as a
+    uint8 matrix. Distances of 255 or more are stored as UNREACHABLE.
+    '''
+
+    def __init__(self, distances):
+        """Constructor
+
+        Arguments:
+            distances {ndarray} -- Square uint8 matrix, row i holds the hop
+            distances from node i
+        """
+        if distances.ndim != 2 or distances.shape[0] != distances.shape[1]:
+            raise Exception('Distance matrix must be square')
+        self._distances = distances
+
+    @staticmethod
+    def build(compact_graph, batch_size=256):
+        """Breadth first search from every node, batch_size sources at a time
+
+        Arguments:
+            compact_graph {CompactGraph} -- Topology snapshot
+
+        Keyword Arguments:
+            batch_size {int} -- Number of searches advanced together (default: {256})
+
+        Returns:
+            DistanceMatrix -- Distances of the graph
+        """
+        size = compact_graph.number_of_nodes()
+        adjacency = sparse.csr_matrix(
+            (numpy.ones(len(compact_graph.indices), dtype=numpy.float32),
+             compact_graph.indices, compact_graph.offsets), shape=(size, size))
+        distances = numpy.full((size, size), UNREACHABLE, dtype=numpy.uint8)
+        for start in range(0, size, batch_size):
+            sources = numpy.arange(start, min(start + batch_size, size))
+            # column j is the search started at sources[j]
+            reached = numpy.zeros((size, len(sources)), dtype=bool)
+            reached[sources, numpy.arange(len(sources))] = True
+            frontier = reached.astype(numpy.float32)
+            level = 0
+            distances[sources, sources] = 0
+            while level < UNREACHABLE - 1:
+                level += 1
+                found = (adjacency.dot(frontier) > 0) & ~reached
+                if not found.any():
+                    break
+                reached |= found
+                rows, columns = numpy.nonzero(found)
+                distances[sources[columns], rows] = level
+                frontier = found.astype(numpy.float32)
+        return DistanceMatrix(distances)
+
+    @staticmethod
+    def load_or_build(compact_graph, file_path):
+        """Load the distances stored in a file, building and storing them if missing
+
+        Arguments:
+            compact_graph {CompactGraph} -- Topology snapshot
+            file_path {str} -- Path of the .npy file next to the graph file
+
+        Returns:
+            DistanceMatrix -- Distances of the graph
+        """
+        size = compact_graph.number_of_nodes()
+        if os.path.exists(file_path):
+            distances = numpy.load(file_path, mmap_mode='r')
+            if distances.shape == (size, size) and distances.dtype == numpy.uint8:
+                return DistanceMatrix(distances)
+        matrix = DistanceMatrix.build(compact_graph)
+        numpy.save(file_path, matrix.distances)
+        return matrix
+
+    @property
+    def distances(self):
+        ''' The uint8 distance matrix '''
+        return self._distances
+
+    def distances_from(self, node_id):
+        '''
+        Hop distance from a node to every node
+        :param node_id: ID of the node
+        :return: uint8 ndarray row of the matrix
+        '''
+        return self._distances[node_id]
+
+    def avoiding_distances(self, compact_graph, avoid_id, node_id):
+        '''
+        Hop distance from a node to every node without passing through another
+        node. Nodes with a shortest path around the avoided node keep their
+        distance, only the nodes behind it are relaxed again.
+        :param compact_graph: CompactGraph the matrix was built on
+        :param avoid_id: ID of the node that can not be passed
+        :param node_id: ID of the node the distances are measured from
+        :return: int16 ndarray of distances, UNREACHABLE for the avoided node
+            and nodes that can only be reached through it
+        '''
+        from_node = self._distances[node_id].astype(numpy.int16)
+        from_avoid = self._distances[avoid_id].astype(numpy.int16)
+        # a shortest path passes the avoided node if the detour is not longer
+        behind = from_node[avoid_id] + from_avoid <= from_node
+        behind &= from_node < UNREACHABLE
+        result = from_node.copy()
+        result[behind] = UNREACHABLE
+        result[avoid_id] = UNREACHABLE
+
+        nodes = numpy.flatnonzero(behind)
+        nodes = nodes[nodes != avoid_id]
+        if len(nodes) == 0:
+            return result
+        neighbors = compact_graph.gather_neighbors(nodes)
+        starts = numpy.cumsum(compact_graph.offsets[nodes + 1] -
+                              compact_graph.offsets[nodes])
+        starts = numpy.concatenate(([0], starts[:-1]))
+        # the neighbour distances are upper bounds, repeat until they settle
+        while True:
+            closest = numpy.minimum.reduceat(result[neighbors], starts) + 1
+            relaxed = numpy.minimum(result[nodes], numpy.minimum(closest, UNREACHABLE))
+            if (relaxed == result[nodes]).all():
+                return result
+            result[nodes] = relaxed
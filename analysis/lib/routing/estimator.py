@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+'''
+Updated on March, 2018
+@author: Todd Baumeister <tbaumeist@gmail.com>
+
+Monte Carlo estimation of the sender probabilities of an interception
+'''
+import numpy
+
+
+def estimate_sender_distribution(compact_graph, ranks, adversary_id, previous_id, hop,
+                                 sender_nodes, randomness, samples, random_state=None):
+    """Estimate the probability of each sender by simulating greedy routing
+
+    Every sender starts samples walkers, all walkers advance together. At each
+    hop a walker takes one of its first routing choices, or a random neighbour
+    with probability randomness. Walkers that revisit a node or reach the
+    adversary are dropped. A walker counts for its sender if it reaches the
+    previous node after hop - 1 hops. The last hop to the adversary is the same
+    for every sender and is left out, like the level 1 node of a routing tree.
+    The standard error of a sender's hit rate p is sqrt(p * (1 - p) / samples).
+
+    Arguments:
+        compact_graph {CompactGraph} -- Topology snapshot
+        ranks {ndarray} -- Rank table of the target, see route_prediction.rank_table
+        adversary_id {int} -- ID of the adversary node
+        previous_id {int} -- ID of the node that forwarded to the adversary
+        hop {int} -- Hop count the message was intercepted at
+        sender_nodes {ndarray} -- IDs of the nodes that could have sent the message
+        randomness {float} -- Probability the router picks a random neighbour
+        samples {int} -- Number of walkers started from each sender
+
+    Keyword Arguments:
+        random_state {RandomState} -- Source of the random numbers, a new
+        unseeded one if not set (default: {None})
+
+    Returns:
+        dict -- Dict with key of node id and value of normalized probability
+    """
+    if random_state is None:
+        random_state = numpy.random.RandomState()
+    sender_nodes = numpy.asarray(sender_nodes, dtype=numpy.int64)
+    if len(sender_nodes) == 0:
+        return {}
+
+    # forward CSR of the first routing choices, ties included
+    offsets = compact_graph.offsets
+    first_choice = ranks == 1
+    choices = compact_graph.indices[first_choice]
+    choice_counts = numpy.bincount(compact_graph.sources[first_choice],
+                                   minlength=compact_graph.number_of_nodes())
+    choice_offsets = numpy.cumsum(choice_counts) - choice_counts
+    degrees = numpy.diff(offsets)
+
+    owners = numpy.repeat(numpy.arange(len(sender_nodes)), samples)
+    positions = numpy.repeat(sender_nodes, samples)
+    history = [positions]
+    for step in range(1, hop):
+        counts = choice_counts[positions]
+        # a random neighbour instead of a first choice, dead ends drop out below
+        use_random = random_state.random_sample(len(positions)) < randomness
+        counts[use_random] = degrees[positions[use_random]]
+        starts = numpy.where(use_random, offsets[positions], choice_offsets[positions])
+        picks = starts + (random_state.random_sample(len(positions)) * counts).astype(numpy.int64)
+
+        moving = counts > 0
+        next_positions = numpy.full(len(positions), -1, dtype=numpy.int64)
+        random_moves = moving & use_random
+        first_moves = moving & ~use_random
+        next_positions[random_moves] = compact_graph.indices[picks[random_moves]]
+        next_positions[first_moves] = choices[picks[first_moves]]
+
+        # keep the walkers still on a simple path to the adversary
+        keep = moving
+        for visited in history:
+            keep &= next_positions != visited
+        keep &= next_positions != adversary_id
+        if step == hop - 1:
+            keep &= next_positions == previous_id
+        owners = owners[keep]
+        positions = next_positions[keep]
+        history = [visited[keep] for visited in history] + [positions]
+
+    hits = numpy.bincount(owners, minlength=len(sender_nodes))
+    total = hits.sum()
+    if total == 0:
+        # no walker reproduced the interception, add all nodes with equal distribution
+        return dict((node_id, 1.0 / len(sender_nodes)) for node_id in sender_nodes.tolist())
+    return dict(zip(sender_nodes.tolist(), (hits / float(total)).tolist()))
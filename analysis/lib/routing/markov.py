@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+'''
+Updated on March, 2018
+@author: Todd Baumeister <tbaumeist@gmail.com>
+
+Markov chain model of the routing choices towards a target
+'''
+import numpy
+from scipy import sparse
+
+
+def transition_matrix(compact_graph, ranks, rank_probability):
+    """Sparse transition matrix of a router choosing neighbours by rank
+
+    Arguments:
+        compact_graph {CompactGraph} -- Topology snapshot
+        ranks {ndarray} -- Rank table of the target, see route_prediction.rank_table
+        rank_probability {function} -- Takes a rank and returns the probability
+        the router picks a neighbour of that rank, negative values count as 0
+
+    Returns:
+        csr_matrix -- Probability of moving from node i to node j, each row
+        with a non zero weight sums to 1
+    """
+    size = compact_graph.number_of_nodes()
+    weights = numpy.zeros(0, dtype=numpy.float64)
+    if len(ranks) > 0:
+        # only a handful of distinct ranks, look the probabilities up once
+        weights = numpy.array([0.0] + [max(rank_probability(rank), 0.0)
+                                       for rank in range(1, int(ranks.max()) + 1)])[ranks]
+    totals = numpy.bincount(compact_graph.sources, weights, minlength=size)
+    scale = numpy.zeros(size, dtype=numpy.float64)
+    numpy.divide(1.0, totals, out=scale, where=totals > 0)
+    return sparse.csr_matrix(
+        (weights * scale[compact_graph.sources], compact_graph.indices,
+         compact_graph.offsets), shape=(size, size))
+
+
+def sender_distribution_markov(transitions, adversary_id, previous_id, hop, sender_nodes):
+    """Probability of each sender given the message was intercepted at a hop
+
+    The arrival probabilities are propagated backwards from the previous node,
+    one sparse matrix vector product per hop. Walks through the adversary are
+    removed at every step, the last hop to the adversary is the same for every
+    sender and is left out.
+
+    Arguments:
+        transitions {csr_matrix} -- Transition matrix, see transition_matrix
+        adversary_id {int} -- ID of the adversary node
+        previous_id {int} -- ID of the node that forwarded to the adversary
+        hop {int} -- Hop count the message was intercepted at
+        sender_nodes {list} -- IDs of the nodes that could have sent the message
+
+    Returns:
+        dict -- Dict with key of node id and value of normalized probability
+    """
+    sender_nodes = numpy.asarray(sender_nodes, dtype=numpy.int64)
+    if len(sender_nodes) == 0:
+        return {}
+
+    # arrival[i] is the probability a message sent by i is at the previous node
+    # after the hops taken so far, without passing the adversary
+    arrival = numpy.zeros(transitions.shape[0], dtype=numpy.float64)
+    arrival[previous_id] = 1.0
+    for _ in range(hop - 1):
+        arrival = transitions.dot(arrival)
+        arrival[adversary_id] = 0.0
+
+    probabilities = arrival[sender_nodes]
+    total = probabilities.sum()
+    if total <= 0.0:
+        # no walk reaches the previous node, add all nodes with equal distribution
+        return dict((node_id, 1.0 / len(sender_nodes)) for node_id in sender_nodes.tolist())
+    return dict(zip(sender_nodes.tolist(), (probabilities / total).tolist()))
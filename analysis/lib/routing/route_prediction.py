@@ -5,7 +5,9 @@ Updated on SeptFeburary, 2018
 
 Collection of route prediction functions
 '''
+import numpy
 from lib.utils import distance
+from lib.routing.compact_graph import CompactGraph, neighbor_locations
 
 
 def rank_greedy(node_id, target_location, nx_graph, cache=None):
@@ -14,7 +16,7 @@ def rank_greedy(node_id, target_location, nx_graph, cache=None):
     Arguments:
         node_id {int} -- ID of the node to calculate routing paths
         target_location {float} -- Target location to route to
-        nx_graph {Graph} -- Netwrokx graph object
+        nx_graph {Graph} -- Netwrokx graph object or CompactGraph
         cache {dict}  -- Dict used to store cached calculations
 
     Returns:
@@ -23,8 +25,8 @@ def rank_greedy(node_id, target_location, nx_graph, cache=None):
     if cache is not None and node_id in cache:
         return cache[node_id]
     peers = {}
-    for child_id in nx_graph.neighbors(node_id):
-        dist = distance(nx_graph.node[child_id]['location'], target_location)
+    for child_id, location in neighbor_locations(nx_graph, node_id):
+        dist = distance(location, target_location)
         if dist not in peers:
             peers[dist] = []
         peers[dist].append(child_id)
@@ -43,7 +45,7 @@ def rank_greedy_2_hop(node_id, target_location, nx_graph, cache=None):
     Arguments:
         node_id {int} -- ID of the node to calculate routing paths
         target_location {float} -- Target location to route to
-        nx_graph {Graph} -- Netwrokx graph object
+        nx_graph {Graph} -- Netwrokx graph object or CompactGraph
         cache {dict}  -- Dict used to store cached calculations
 
     Returns:
@@ -53,12 +55,11 @@ def rank_greedy_2_hop(node_id, target_location, nx_graph, cache=None):
         return cache[node_id]
 
     peers = {}
-    for child_id in nx_graph.neighbors(node_id):
-        dist = distance(nx_graph.node[child_id]['location'], target_location)
+    for child_id, location in neighbor_locations(nx_graph, node_id):
+        dist = distance(location, target_location)
         # check if peer of peers make us closer
-        for child_child_id in nx_graph.neighbors(child_id):
-            dist_child = distance(
-                nx_graph.node[child_child_id]['location'], target_location)
+        for _, child_location in neighbor_locations(nx_graph, child_id):
+            dist_child = distance(child_location, target_location)
             if dist_child < dist:
                 dist = dist_child
             
@@ -72,3 +73,310 @@ def rank_greedy_2_hop(node_id, target_location, nx_graph, cache=None):
     if cache is not None:
         cache[node_id] = ordered_list
     return ordered_list
+
+
+def circular_distances(locations, target_locations):
+    """Vectorized version of lib.utils.distance
+
+    Arguments:
+        locations {ndarray} -- Node locations
+        target_locations {ndarray|float} -- Target location(s) to measure against
+
+    Returns:
+        ndarray -- Rounded distances in the circular address space
+    """
+    values = numpy.minimum(numpy.abs(locations - target_locations),
+                           numpy.minimum(numpy.abs((locations + 1) - target_locations),
+                                         numpy.abs(locations - (target_locations + 1))))
+    return numpy.round(values, 10)
+
+
+def target_distances(compact_graph, target_location, look_ahead=1):
+    """Distance of every node to a target as seen by a greedy router
+
+    Arguments:
+        compact_graph {CompactGraph} -- Topology snapshot
+        target_location {float} -- Target location to route to
+
+    Keyword Arguments:
+        look_ahead {int} -- Number of hops the router looks ahead, a node is
+        scored by the closest location within look_ahead - 1 hops (default: {1})
+
+    Returns:
+        ndarray -- Rounded distance of each node, same as lib.utils.distance
+    """
+    scores = circular_distances(compact_graph.locations, target_location)
+    offsets = compact_graph.offsets
+    has_neighbors = offsets[1:] > offsets[:-1]
+    for _ in range(look_ahead - 1):
+        if not has_neighbors.any():
+            break
+        # closest score among the neighbours of each node, empty segments are skipped
+        closest = numpy.minimum.reduceat(
+            scores[compact_graph.indices], offsets[:-1][has_neighbors])
+        scores = scores.copy()
+        scores[has_neighbors] = numpy.minimum(scores[has_neighbors], closest)
+    return scores
+
+
+def rank_table(compact_graph, target_location, look_ahead=1):
+    """Rank of every neighbour of every node routing towards a target
+
+    Arguments:
+        compact_graph {CompactGraph} -- Topology snapshot
+        target_location {float} -- Target location to route to
+
+    Keyword Arguments:
+        look_ahead {int} -- Number of hops the router looks ahead (default: {1})
+
+    Returns:
+        ndarray -- int32 rank (starting at 1) of indices[e] in the routing
+        choices of sources[e], aligned with the CSR edges
+    """
+    scores = target_distances(compact_graph, target_location, look_ahead)
+    sources = compact_graph.sources
+    dists = scores[compact_graph.indices]
+    # sort each neighbour segment by distance, stable so ties keep neighbour order
+    order = numpy.lexsort((dists, sources))
+    sorted_sources = sources[order]
+    sorted_dists = dists[order]
+
+    # a new rank group starts when the segment or the distance changes
+    segment_start = numpy.ones(len(order), dtype=bool)
+    segment_start[1:] = sorted_sources[1:] != sorted_sources[:-1]
+    group_start = segment_start.copy()
+    group_start[1:] |= sorted_dists[1:] != sorted_dists[:-1]
+    groups = numpy.cumsum(group_start)
+    first_groups = numpy.maximum.accumulate(numpy.where(segment_start, groups, 0))
+
+    ranks = numpy.empty(len(order), dtype=numpy.int32)
+    ranks[order] = groups - first_groups + 1
+    return ranks
+
+
+def first_choice_senders(compact_graph, ranks):
+    """Reverse adjacency of the greedy next-hop forest towards a target
+
+    Nodes whose first routing choice is a node, tied first choices included,
+    so the rank 1 routing paths into a node are read off without ranking its
+    neighbours.
+
+    Arguments:
+        compact_graph {CompactGraph} -- Topology snapshot
+        ranks {ndarray} -- Rank table of the target, see rank_table
+
+    Returns:
+        tuple -- (offsets, senders) arrays, the senders of node i are
+        senders[offsets[i]:offsets[i + 1]] in the node's neighbour order
+    """
+    first_choice = ranks[compact_graph.reverse_edges] == 1
+    senders = compact_graph.indices[first_choice]
+    counts = numpy.bincount(compact_graph.sources[first_choice],
+                            minlength=compact_graph.number_of_nodes())
+    offsets = numpy.zeros(compact_graph.number_of_nodes() + 1, dtype=numpy.int64)
+    numpy.cumsum(counts, out=offsets[1:])
+    return offsets, senders
+
+
+def rank_greedy_vectorized(node_id, target_location, nx_graph, cache=None):
+    """Calculate the sorted routing choices for a node using numpy
+
+    Arguments:
+        node_id {int} -- ID of the node to calculate routing paths
+        target_location {float} -- Target location to route to
+        nx_graph {Graph} -- Netwrokx graph object or CompactGraph
+        cache {dict}  -- Dict used to store cached calculations
+
+    Returns:
+        List -- Ordered list of list of node ids. Ordered by rank.
+    """
+    if cache is not None and node_id in cache:
+        return cache[node_id]
+
+    if isinstance(nx_graph, CompactGraph):
+        neighbors = nx_graph.neighbor_array(node_id)
+        locations = nx_graph.locations[neighbors]
+    else:
+        pairs = neighbor_locations(nx_graph, node_id)
+        neighbors = numpy.array([i[0] for i in pairs], dtype=numpy.int64)
+        locations = numpy.array([i[1] for i in pairs], dtype=numpy.float64)
+
+    dists = circular_distances(locations, target_location)
+    # stable sort keeps the neighbour order for ties, same as rank_greedy
+    order = numpy.argsort(dists, kind='mergesort')
+    sorted_dists = dists[order]
+    sorted_nodes = neighbors[order].tolist()
+    # a new rank group starts wherever the sorted distance changes
+    bounds = [0] + (numpy.flatnonzero(sorted_dists[1:] != sorted_dists[:-1]) + 1).tolist() + \
+        [len(sorted_nodes)]
+    ordered_list = [sorted_nodes[bounds[i]:bounds[i + 1]]
+                    for i in range(len(bounds) - 1)]
+
+    if cache is not None:
+        cache[node_id] = ordered_list
+    return ordered_list
+
+
+def rank_greedy_batch(node_ids, target_locations, compact_graph):
+    """Calculate the sorted routing choices for many (node, target) pairs at once
+
+    Arguments:
+        node_ids {list} -- IDs of the nodes to calculate routing paths
+        target_locations {list|float} -- Target location for each node, or one
+        location shared by every node
+        compact_graph {CompactGraph} -- Topology snapshot
+
+    Returns:
+        List -- Ordered list of list of node ids for each pair, same contract as rank_greedy
+    """
+    node_ids = numpy.asarray(node_ids, dtype=numpy.int64)
+    target_locations = numpy.broadcast_to(
+        numpy.asarray(target_locations, dtype=numpy.float64), node_ids.shape)
+    if len(node_ids) == 0:
+        return []
+
+    # flatten the CSR neighbour segments of every requested node
+    starts = compact_graph.offsets[node_ids]
+    counts = compact_graph.offsets[node_ids + 1] - starts
+    segments = numpy.repeat(numpy.arange(len(node_ids)), counts)
+    segment_starts = numpy.cumsum(counts) - counts
+    edges = numpy.arange(counts.sum()) - \
+        numpy.repeat(segment_starts, counts) + numpy.repeat(starts, counts)
+    neighbors = compact_graph.indices[edges]
+    dists = circular_distances(
+        compact_graph.locations[neighbors], target_locations[segments])
+
+    # sort by segment then distance, stable so ties keep neighbour order
+    order = numpy.lexsort((dists, segments))
+    segments = segments[order]
+    dists = dists[order]
+    neighbors = neighbors[order].tolist()
+
+    # a new rank group starts when the segment or the distance changes
+    is_start = numpy.ones(len(order), dtype=bool)
+    is_start[1:] = (segments[1:] != segments[:-1]) | (dists[1:] != dists[:-1])
+    group_starts = numpy.flatnonzero(is_start).tolist() + [len(order)]
+    group_segments = segments[group_starts[:-1]].tolist()
+
+    ranked = [[] for _ in range(len(node_ids))]
+    for i, segment in enumerate(group_segments):
+        ranked[segment].append(neighbors[group_starts[i]:group_starts[i + 1]])
+    return ranked
+
+
+class RankGreedyKHop(object):
+    '''
+    Greedy ranking with a look ahead of k hops. A neighbour is ranked by the
+    closest location reachable within k-1 hops of it. The reachable locations
+    of each node are kept as a sorted ring per graph, so the closest one to a
+    target is found with a binary search instead of enumerating the neighbourhood.
+    '''
+
+    def __init__(self, look_ahead):
+        """Constructor
+
+        Arguments:
+            look_ahead {int} -- Number of hops the router looks ahead, starts at 1
+        """
+        if look_ahead < 1:
+            raise Exception('Look ahead must be at least 1 hop')
+        self.look_ahead = look_ahead
+        self._graph = None
+        self._compact_graph = None
+        self._rings = {}
+
+    def __call__(self, node_id, target_location, nx_graph, cache=None):
+        """Calculate the sorted routing choices for a node
+
+        Arguments:
+            node_id {int} -- ID of the node to calculate routing paths
+            target_location {float} -- Target location to route to
+            nx_graph {Graph} -- Netwrokx graph object or CompactGraph
+            cache {dict}  -- Dict used to store cached calculations
+
+        Returns:
+            List -- Ordered list of list of node ids. Ordered by rank.
+        """
+        if cache is not None and node_id in cache:
+            return cache[node_id]
+
+        compact_graph = self._get_compact_graph(nx_graph)
+        # networkx node ids are translated to the indices of the compact graph
+        is_compact = compact_graph is nx_graph
+        index = node_id if is_compact else compact_graph.node_index(node_id)
+        peers = {}
+        for child_id in compact_graph.neighbors(index):
+            dist = self.best_distance(compact_graph, child_id, target_location)
+            if dist not in peers:
+                peers[dist] = []
+            peers[dist].append(child_id)
+
+        ordered = sorted(peers.items(), key=lambda x: x[0])
+        if is_compact:
+            ordered_list = [i[1] for i in ordered]
+        else:
+            ordered_list = [compact_graph.to_node_ids(i[1]) for i in ordered]
+
+        if cache is not None:
+            cache[node_id] = ordered_list
+        return ordered_list
+
+    def best_distance(self, nx_graph, node_id, target_location):
+        """Closest distance to the target from any node within k-1 hops
+
+        Arguments:
+            nx_graph {Graph} -- Netwrokx graph object or CompactGraph
+            node_id {int} -- ID of the node to look ahead from
+            target_location {float} -- Target location to route to
+
+        Returns:
+            float -- Rounded circular distance, same as lib.utils.distance
+        """
+        ring = self.reach_locations(nx_graph, node_id)
+        index = int(numpy.searchsorted(ring, target_location))
+        # the closest location is a direct neighbour of the target in the ring,
+        # wrapping around the ends of the address space
+        before = ring[index - 1] if index > 0 else ring[-1]
+        after = ring[index] if index < len(ring) else ring[0]
+        return min(distance(before, target_location), distance(after, target_location))
+
+    def reach_locations(self, nx_graph, node_id):
+        """Sorted locations of every node within k-1 hops, including the node itself
+
+        Arguments:
+            nx_graph {Graph} -- Netwrokx graph object or CompactGraph
+            node_id {int} -- ID of the node to look ahead from
+
+        Returns:
+            ndarray -- Sorted float64 locations
+        """
+        compact_graph = self._get_compact_graph(nx_graph)
+        if compact_graph is not nx_graph:
+            node_id = compact_graph.node_index(node_id)
+        ring = self._rings.get(node_id)
+        if ring is None:
+            reached = numpy.zeros(compact_graph.number_of_nodes(), dtype=bool)
+            reached[node_id] = True
+            frontier = numpy.array([node_id], dtype=numpy.int64)
+            for _ in range(self.look_ahead - 1):
+                if len(frontier) == 0:
+                    break
+                neighbors = numpy.concatenate(
+                    [compact_graph.neighbor_array(i) for i in frontier])
+                frontier = numpy.unique(neighbors[~reached[neighbors]])
+                reached[frontier] = True
+            ring = numpy.sort(compact_graph.locations[reached])
+            ring.flags.writeable = False
+            self._rings[node_id] = ring
+        return ring
+
+    def _get_compact_graph(self, nx_graph):
+        # rings are only valid for the graph they were calculated on
+        if nx_graph is not self._graph:
+            self._graph = nx_graph
+            self._rings = {}
+            if isinstance(nx_graph, CompactGraph):
+                self._compact_graph = nx_graph
+            else:
+                self._compact_graph = CompactGraph.from_nx_graph(nx_graph)
+        return self._compact_graph
@@ -5,21 +5,35 @@ Updated on September, 2017
 
 Class for storing and building potentical routing trees
 '''
+import bisect
+import heapq
 import logging
 import math
+import sys
+import time
+from array import array
+import numpy
 from lib.utils import average_degree, distance
+from lib.routing.cache import RankCache, SenderSetCache
+from lib.routing import tree_encoding
 
 
 class RoutingTree(object):
     '''
-    Represents a potential routing tree traced back from start node
+    Represents a potential routing tree traced back from start node.
+
+    Entries are stored arena style: an entry is an index into parallel arrays
+    of node id, parent index, level and rank. Index 0 is the root (adversary)
+    and a parent is always stored before its children.
     '''
 
-    def __init__(self, nx_graph, routing_algorithm, max_length=0):
+    def __init__(self, graph, routing_algorithm, max_length=0, rank_cache=None,
+                 max_nodes=0, max_time=0, max_memory=0, prune=True,
+                 sender_set_cache=None, rank_table_cache=None):
         """Constructor
 
         Arguments:
-            nx_graph {Graph} -- Topology graph
+            graph {Graph} -- Topology graph, networkx Graph or CompactGraph
             routing_algorithm {function} -- Routing algorithm used by protocol
 
         Keyword Arguments:
@@ -27,47 +41,154 @@ class RoutingTree(object):
             a path for from each node. Top nodes will be followed. (default: {2})
             max_length {int} -- Maximum number of hops to calculate routing paths.
             (default: {0})
+            rank_cache {RankCache} -- Rank cache shared between trees built on the
+            same graph and routing algorithm. A private cache is used for each
+            build if not set. (default: {None})
+            max_nodes {int} -- Maximum number of tree entries per build, 0 is
+            unbounded (default: {0})
+            max_time {float} -- Maximum seconds spent building the routing paths,
+            the build and its extensions share the budget. 0 is unbounded (default: {0})
+            max_memory {int} -- Maximum estimated bytes held by the tree entries,
+            0 is unbounded (default: {0})
+            prune {bool} -- Leave out branches that can not reach the intercepted
+            hop. The sender distributions are the same either way. (default: {True})
+            sender_set_cache {SenderSetCache} -- Sender set cache shared between
+            trees built on the same graph. A private cache is used for each
+            build if not set. (default: {None})
+            rank_table_cache {RankTableCache} -- Rank tables of the graph, replaces
+            the rank cache. The graph must be the CompactGraph of the cache.
+            (default: {None})
         """
-        self._root = None
-        self._levels = {}
-        self._sender_set = set()
-        self._cache_rank_calculations = {}
+        self._reset()
 
-        self._nx_graph = nx_graph
+        self._graph = graph
         self._routing_algorithm = routing_algorithm
         self._max_length = max_length
-
-    def build(self, adversary_node_id, previous_node_id, max_hop, target_address):
+        self._shared_rank_cache = rank_cache
+        self._rank_cache = rank_cache
+        self._max_nodes = max_nodes
+        self._max_time = max_time
+        self._max_memory = max_memory
+        self._prune = prune
+        self._shared_sender_set_cache = sender_set_cache
+        self._sender_set_cache = sender_set_cache
+        self._rank_table_cache = rank_table_cache
+
+    def build(self, adversary_node_id, previous_node_id, max_hop, target_address,
+              horizon=0):
         """Build the sender set and routing paths
 
+        A build that runs out of its node, time or memory budget stops early and
+        keeps the partially built routing paths, see is_partial.
+
         Arguments:
-            adversary_node_id {int} -- ID of the adversary node in the nx_graph
-            previous_node_id {int} -- ID of the previous node in the nx_graph
+            adversary_node_id {int} -- ID of the adversary node in the graph
+            previous_node_id {int} -- ID of the previous node in the graph
             max_hop {int} -- Number of hops to calculate the sender set and routing 
             paths back to
             target_address {float} -- Address of the node the message is routing to
+
+        Keyword Arguments:
+            horizon {int} -- Largest hop the tree will be extended to, branches are
+            only pruned if they can not reach it either (default: {0})
         """
-        self._root = None
-        self._levels = {}
-        self._sender_set = set()
-        self._cache_rank_calculations = {}
+        self._reset()
+        if self._shared_rank_cache is None:
+            self._rank_cache = RankCache(self._graph, self._routing_algorithm)
+        if self._shared_sender_set_cache is None:
+            self._sender_set_cache = SenderSetCache(self._graph)
+        if self._rank_table_cache is not None:
+            if self._rank_table_cache.graph is not self._graph:
+                raise Exception('Rank tables were calculated on a different graph')
+            self._rank_table = self._rank_table_cache.get_rank_table(target_address)
+            self._first_choices = self._rank_table_cache.get_first_choice_senders(
+                target_address)
 
         if self._max_length > 0 and max_hop > self._max_length:
             return False
 
         # calculate the sender set
-        self._sender_set.add(adversary_node_id)
-        self._build_sender_set([previous_node_id], max_hop)
-        self._sender_set.remove(adversary_node_id)
+        self._sender_nodes = self._sender_set_cache.get_sender_set(
+            adversary_node_id, previous_node_id, max_hop)
+        self._horizon = max(horizon, max_hop)
+        self._room_set = frozenset(self._sender_set_cache.get_sender_set(
+            adversary_node_id, previous_node_id, self._horizon).tolist())
 
         # calculate the preferred routing paths
-        self._root = RoutingTree._Entry(adversary_node_id, 0)
-        self._levels[0] = [self._root]
-        prev_node = self._add_child(self._root, previous_node_id, 1)
+        self._max_hop = max_hop
+        self._target_address = target_address
+        self._start_time = time.time()
+        root = self._add_entry(adversary_node_id, -1, 1)
+        prev_node = self._add_entry(previous_node_id, root, 1)
         self._build_tree([prev_node], max_hop, target_address)
+        self._stop_clock()
+
+        return True
 
+    def extend(self):
+        """Extend the sender set and routing paths of a built tree by one hop
+
+        The result is the same as building the tree for the next hop, only the
+        entries of the last level still need their routing choices.
+
+        Returns:
+            bool -- False if the next hop is longer than the maximum length
+        """
+        if len(self._node_ids) == 0:
+            raise Exception('Tree must be built before it can be extended')
+        max_hop = self._max_hop + 1
+        if self._max_length > 0 and max_hop > self._max_length:
+            return False
+        if self._prune and max_hop > self._horizon:
+            raise Exception('Unable to extend a pruned tree past its horizon')
+
+        adversary_node_id = self._node_ids[0]
+        previous_node_id = self._node_ids[1]
+        self._sender_nodes = self._sender_set_cache.get_sender_set(
+            adversary_node_id, previous_node_id, max_hop)
+        self._rank_set = None
+        self._children_index = None
+
+        last_level = list(self._levels.get(self._max_hop, []))
+        self._max_hop = max_hop
+        self._start_time = time.time()
+        self._build_tree(last_level, max_hop, self._target_address)
+        self._stop_clock()
         return True
 
+    def get_max_hop(self):
+        '''
+        Hop count the tree was last built or extended to
+        :return: int hop count
+        '''
+        return self._max_hop
+
+    def get_horizon(self):
+        '''
+        Largest hop count the tree can be extended to
+        :return: int hop count
+        '''
+        return self._horizon
+
+    def is_partial(self):
+        """Check if the last build stopped early because it ran out of budget
+
+        Returns:
+            bool -- True if the routing paths are incomplete
+        """
+        return self._partial
+
+    def get_build_stats(self):
+        """How much of the routing paths the last build explored
+
+        Returns:
+            dict -- Number of tree entries, tree height, seconds spent, the
+            estimated bytes held by the entries and the number of pruned branches
+        """
+        return {'nodes': len(self._node_ids), 'height': self.get_height(),
+                'pruned': self._pruned,
+                'seconds': round(self._elapsed(), 3), 'memory': self._memory}
+
     def get_data_at_level(self, level):
         '''
         Get all inserted data at a given level
@@ -77,7 +198,7 @@ class RoutingTree(object):
         '''
         if abs(level) > self.get_height() - 1:
             raise Exception('Out of bound index')
-        return [i.data for i in self._levels[abs(level)]]
+        return [self._node_ids[i] for i in self._levels[abs(level)]]
 
     def get_height(self):
         '''
@@ -89,10 +210,10 @@ class RoutingTree(object):
     def get_sender_set(self):
         '''
         Return the list of the sender set
-        :return: Unique list of senders
+        :return: Unique sorted list of senders
         '''
         # its dumb, set is not json serializable so turn it back into a list
-        return list(self._sender_set)
+        return self._sender_nodes.tolist()
 
     def get_sender_set_rank(self):
         """Calculate the rank of the sender set
@@ -104,28 +225,32 @@ class RoutingTree(object):
         if self.get_height() < 2:
             return {}
         if self.get_height() == 2:
-            return {1: [self._root.children[0].data]}
+            return {1: [self._node_ids[1]]}
         # known its 100% for the level 1 node (previous), so we can skip
 
+        if self._rank_set is not None:
+            return self._rank_set
+
         # use rank value instead of a distribution
         def dist_function(rank): return rank
 
-        def add_function(a, b): return a + b
+        def add_function(sums, rank): return frozenset(s + rank for s in sums)
 
-        # assign distribution
-        ranks = self._assign_sender_dist(
-            dist_function, self._root.children[0], self.get_height() - 3, 1, add_function)
+        # a node is listed under the summed rank of each of its paths
+        ranks = self._aggregate_sender_dist(dist_function, add_function, frozenset.union,
+                                            frozenset([1]))
         rank_set = {}
         largest_rank = 0
         processed_set = set()
 
-        for node, rank in ranks:
-            if rank not in rank_set:
-                rank_set[rank] = set()
-            rank_set[rank].add(node)
+        for node, sums in ranks.items():
+            for rank in sums:
+                if rank not in rank_set:
+                    rank_set[rank] = set()
+                rank_set[rank].add(node)
 
-            if rank > largest_rank:
-                largest_rank = rank
+                if rank > largest_rank:
+                    largest_rank = rank
             processed_set.add(node)
 
         # add in remaining nodes from the sender set
@@ -141,6 +266,7 @@ class RoutingTree(object):
         for rank in rank_set.keys():
             rank_set[rank] = list(rank_set[rank])
 
+        self._rank_set = rank_set
         return rank_set
 
     def get_sender_set_distribution_full(self):
@@ -192,27 +318,22 @@ class RoutingTree(object):
         if self.get_height() < 2:
             return {}
         if self.get_height() == 2:
-            return {self._root.children[0].data: 1}
+            return {self._node_ids[1]: 1}
         # known its 100% for the level 1 node (previous), so we can skip
 
         def mult(a, b): return a * b
 
-        distro = self._assign_sender_dist(
-            dist_function, self._root.children[0], self.get_height() - 3, 1, mult)
+        def add(a, b): return a + b
+
+        # combine entries for the same nodes level by level
+        distro_set = self._aggregate_sender_dist(dist_function, mult, add)
 
         # every node in the sender set and not in this distribution set has a probability of zero
         # Don't need to add these since they will not affect the final probability distribution
 
-        assert(len(distro) > 0)
+        assert(len(distro_set) > 0)
 
-        # combine entries for the same nodes
-        distro_set = {}
-        total = 0.0
-        for node, prob in distro:
-            if node not in distro_set:
-                distro_set[node] = 0
-            distro_set[node] = distro_set[node] + prob
-            total = total + prob
+        total = sum(distro_set.values())
 
         # normalize the distributions (e.g. their sum == 1)
         if total > 0.0:
@@ -222,7 +343,7 @@ class RoutingTree(object):
         else:
             # add all nodes with equal distribution
             for node_id in self.get_sender_set():
-                distro_set[node_id] = 1.0 / len(self.get_sender_set())
+                distro_set[node_id] = 1.0 / len(self._sender_nodes)
 
         # add in any missing nodes from the sender set
         for node_id in self.get_sender_set():
@@ -243,81 +364,192 @@ class RoutingTree(object):
         """
         return 0.5 ** rank
 
-    def to_bracket(self):
+    def to_bracket(self, labels=None):
         """Return the bracket representation of the tree
 
+        Keyword Arguments:
+            labels {ndarray} -- Node id to output for each node of the graph,
+            e.g. CompactGraph.node_ids (default: {None})
+
         Returns:
             string -- String bracket representation of this tree
         """
-        return self._to_bracket(self._root)
+        return tree_encoding.to_bracket(
+            *[values.tolist() for values in self._get_tree_arrays(labels)])
+
+    def to_encoded(self, labels=None):
+        """Return the compact encoding of the tree, see lib.routing.tree_encoding
 
-    def _to_bracket(self, node):
-        if node is None:
+        Keyword Arguments:
+            labels {ndarray} -- Node id to output for each node of the graph,
+            e.g. CompactGraph.node_ids (default: {None})
+
+        Returns:
+            string -- Base64 string of the tree, empty if the tree was not built
+        """
+        if len(self._node_ids) == 0:
             return ''
-        bracket_str = '({}--{}'.format(node.data, node.rank)
-        for child in node.children:
-            bracket_str += self._to_bracket(child)
-        return bracket_str + ')'
+        return tree_encoding.encode_tree(*self._get_tree_arrays(labels))
 
-    def _assign_sender_dist(self, dist_function, node, current_hop_count, prob, action):
-        distro = []
-        for child in node.children:
-            child_prob = dist_function(child.rank)
+    def _get_tree_arrays(self, labels=None):
+        """Node id, parent offset and rank of the entries in the tree's output
 
-            combined_prob = action(prob, child_prob)
+        Keyword Arguments:
+            labels {ndarray} -- Node id to output for each node of the graph
+            (default: {None})
 
-            if current_hop_count == 0:
-                distro.append((child.data, combined_prob))
+        Returns:
+            tuple -- (node_ids, parent_offsets, ranks) int32 ndarrays in entry
+            order, pruned branches are left out
+        """
+        node_ids = numpy.frombuffer(self._node_ids, dtype=numpy.int32)
+        parents = numpy.frombuffer(self._parents, dtype=numpy.int32)
+        ranks = numpy.frombuffer(self._ranks, dtype=numpy.int32)
+        if len(node_ids) == 0:
+            return node_ids, parents, ranks
+        if self._prune:
+            keep = self._get_live_mask()
+            keep[0] = True
+            # entries move up by the number of dropped entries before them
+            new_entries = (numpy.cumsum(keep) - 1).astype(numpy.int32)
+            node_ids = node_ids[keep]
+            parents = new_entries[parents[keep][1:]]
+            ranks = ranks[keep]
+        else:
+            parents = parents[1:]
+        parent_offsets = numpy.zeros(len(node_ids), dtype=numpy.int32)
+        parent_offsets[1:] = numpy.arange(1, len(node_ids), dtype=numpy.int32) - parents
+        if labels is not None:
+            node_ids = numpy.asarray(labels)[node_ids].astype(numpy.int32)
+        return node_ids, parent_offsets, ranks
+
+    def _aggregate_sender_dist(self, dist_function, action, merge, previous_value=1):
+        """Carry the combined value of every path down the tree one level at a time
+
+        Arguments:
+            dist_function {function} -- Maps a routing choice rank to a value
+            action {function} -- Combines the value of the parent with the child's value
+            merge {function} -- Combines the values of paths ending at the same sender
+
+        Keyword Arguments:
+            previous_value {object} -- Value of the previous node (default: {1})
+
+        Returns:
+            dict -- Dict with key of sender node id and the merged value of all paths
+            reaching the last level
+        """
+        offsets, children = self._get_children_index()
+        ranks = self._ranks
+        # only the current level is kept, children are visited in order so
+        # values are combined in the same order as a depth first walk
+        frontier = [(1, previous_value)]
+        for _ in range(self.get_height() - 2):
+            next_frontier = []
+            for entry, value in frontier:
+                for child in children[offsets[entry]:offsets[entry + 1]]:
+                    next_frontier.append(
+                        (child, action(value, dist_function(ranks[child]))))
+            frontier = next_frontier
+
+        merged = {}
+        for entry, value in frontier:
+            node_id = self._node_ids[entry]
+            if node_id in merged:
+                merged[node_id] = merge(merged[node_id], value)
             else:
-                distro.extend(self._assign_sender_dist(dist_function,
-                                                       child,
-                                                       current_hop_count - 1,
-                                                       combined_prob,
-                                                       action))
-        return distro
+                merged[node_id] = value
+        return merged
+
+    def _get_children_index(self):
+        """Group the entries by parent, keeping insertion order within a parent
+
+        Returns:
+            tuple -- (offsets, children) lists, the children of entry i are
+            children[offsets[i]:offsets[i + 1]]
+        """
+        if self._children_index is None:
+            parents = numpy.frombuffer(self._parents, dtype=numpy.int32)[1:]
+            order = numpy.argsort(parents, kind='mergesort') + 1
+            if self._prune:
+                # drop the branches that never reached the last level
+                live = self._get_live_mask()
+                order = order[live[order]]
+                parents = parents[live[1:]]
+            counts = numpy.bincount(parents, minlength=len(self._node_ids))
+            offsets = numpy.zeros(len(self._node_ids) + 1, dtype=numpy.int64)
+            numpy.cumsum(counts, out=offsets[1:])
+            self._children_index = (offsets.tolist(), order.tolist())
+        return self._children_index
+
+    def _get_live_mask(self):
+        """Mark the entries that lead to the last level of the tree
+
+        Returns:
+            ndarray -- Boolean mask of the entries with a descendant on the
+            last level, including the last level itself
+        """
+        levels = numpy.frombuffer(self._entry_levels, dtype=numpy.int32)
+        parents = numpy.frombuffer(self._parents, dtype=numpy.int32)
+        live = levels == self.get_height() - 1
+        for level in range(self.get_height() - 1, 0, -1):
+            live[parents[live & (levels == level)]] = True
+        return live
 
     def _get_node_rank(self, to_node_id, from_node_id, target_address):
-        ranked_nodes = self._routing_algorithm(
-            from_node_id, target_address, self._nx_graph, self._cache_rank_calculations)
-        for i in range(0, len(ranked_nodes)):
-            if to_node_id in ranked_nodes[i]:
-                return i + 1
-        raise Exception('Unable to find path between nodes')
+        ranks = self._rank_cache.get_ranks(from_node_id, target_address)
+        if to_node_id not in ranks:
+            raise Exception('Unable to find path between nodes')
+        return ranks[to_node_id]
 
     def _build_tree(self, node_list, max_hop, target_address):
-        last_max_hop = 1
         while True:
             # try to build with only rank #1
-            new_nodes = self._build_tree_routes(
-                node_list, max_hop, target_address)
-            if len(new_nodes) > 0:
-                # reset the max hop to 1
-                last_max_hop = 1
+            self._build_tree_routes(node_list, max_hop, target_address)
 
-            if self.get_height() > max_hop:
+            if self.get_height() > max_hop or self._partial:
+                return
+            if len(self._worklist) == 0:
+                # no untried routing choices left, a complete path can not be built
                 return
             # didn't build a complete path
-            # add next rank to all existing nodes
-            last_max_hop += 1
-            all_nodes = self._get_all_nodes()
+            # relax the lowest pending rank, nodes are visited level by level
+            # in the same order as a full scan of the tree would
+            max_rank = self._worklist[0][0]
+            relax_nodes = []
+            while len(self._worklist) > 0 and self._worklist[0][0] == max_rank:
+                relax_nodes.append(heapq.heappop(self._worklist)[2])
             added_nodes = []
-            for node in all_nodes:
+            for node in relax_nodes:
+                if self._partial:
+                    return
                 added_nodes.extend(self._build_tree_routes_node(
-                    node, target_address, last_max_hop))
-
-            if len(added_nodes) > 0:
-                # reset the max hop to 1
-                last_max_hop = 1
+                    node, target_address, max_rank))
             # only need to start building the tree from the new added nodes
             node_list = added_nodes
 
-    def _get_all_nodes(self):
-        all_nodes = []
-        for level, values in self._levels.items():
-            if level == 0:
-                continue
-            all_nodes.extend(values)
-        return all_nodes
+    def _reset(self):
+        self._node_ids = array('i')
+        self._parents = array('i')
+        self._entry_levels = array('i')
+        self._ranks = array('i')
+        self._ancestors = []
+        self._pending = {}
+        self._worklist = []
+        self._children_index = None
+        self._levels = {}
+        self._sender_nodes = numpy.array([], dtype=numpy.int32)
+        self._room_set = frozenset()
+        self._horizon = 0
+        self._target_address = None
+        self._rank_set = None
+        self._rank_table = None
+        self._first_choices = None
+        self._partial = False
+        self._pruned = 0
+        self._max_hop = 0
+        self._memory = 0
+        self._spent_time = 0.0
+        self._start_time = None
 
     def _build_tree_routes(self, node_list, max_hops, target_address):
         process_nodes = node_list
@@ -325,7 +557,9 @@ class RoutingTree(object):
         while len(process_nodes) > 0:
             added_leaves = []
             for node in process_nodes:
-                if node.level >= max_hops:
+                if self._partial:
+                    return all_nodes_added
+                if self._entry_levels[node] >= max_hops:
                     continue
                 new_nodes = self._build_tree_routes_node(
                     node, target_address, 1)
@@ -335,74 +569,183 @@ class RoutingTree(object):
         return all_nodes_added
 
     def _build_tree_routes_node(self, node, target_address, max_rank):
+        """Add the children of an entry whose rank is at most max_rank
+
+        The neighbours of an entry are ranked once, on the first expansion, and
+        kept sorted by rank. Untried neighbours stay queued in the worklist
+        keyed by (rank, level, entry) until a later relaxation reaches them.
+        Neighbours without a long enough simple path left to reach the
+        intercepted hop are pruned, none of their descendants could end up
+        on the last level.
+
+        Arguments:
+            node {int} -- Index of the entry to expand
+            target_address {float} -- Address the message is routing to
+            max_rank {int} -- Highest rank to add
+
+        Returns:
+            list -- Indices of the added entries
+        """
+        if self._over_budget():
+            self._partial = True
+            return []
+        if max_rank == 1 and self._first_choices is not None and \
+                node not in self._pending:
+            return self._build_tree_first_choices(node)
+        candidates, position = self._pending.pop(node, (None, 0))
+        if candidates is None:
+            node_id = self._node_ids[node]
+            path = self._ancestors[node]
+            if self._rank_table is not None:
+                # the rank of the node in each neighbour's choices is stored
+                # on the edge pointing back at it
+                start = self._graph.offsets[node_id]
+                end = self._graph.offsets[node_id + 1]
+                ranks = self._rank_table[self._graph.reverse_edges[start:end]]
+                candidates = [(rank, child_id) for rank, child_id in
+                              zip(ranks.tolist(), self._graph.indices[start:end].tolist())
+                              if child_id not in path]
+            else:
+                candidates = []
+                for child_id in self._graph.neighbors(node_id):
+                    if child_id in path:
+                        continue
+                    rank = self._get_node_rank(node_id, child_id, target_address)
+                    candidates.append((rank, child_id))
+            # stable, neighbours of the same rank keep the graph order
+            candidates.sort(key=lambda candidate: candidate[0])
+            # a deferred entry holds the highest rank it already added
+            position = bisect.bisect_right(candidates, (position, sys.maxsize))
+
+        # hops still needed below a child to reach the intercepted hop
+        need = self._max_hop - self._entry_levels[node] - 1
+        path = self._ancestors[node]
         added_children = []
-        path = node.get_path()
-        children_ids = node.get_child_ids()
-        for child_id in self._nx_graph.neighbors(node.data):
+        while position < len(candidates) and candidates[position][0] <= max_rank:
+            rank, child_id = candidates[position]
+            position += 1
+            if self._prune and need > 0 and not self._has_room(child_id, path, need):
+                self._pruned += 1
+                continue
+            added_children.append(self._add_entry(child_id, node, rank))
+
+        if position < len(candidates):
+            self._pending[node] = (candidates, position)
+            heapq.heappush(self._worklist,
+                           (candidates[position][0], self._entry_levels[node], node))
+        return added_children
+
+    def _build_tree_first_choices(self, node):
+        """Add the children of an entry that route to it as their first choice
+
+        Fast path for the first expansion, the children are read from the
+        greedy next-hop forest of the target. The other neighbours are only
+        ranked once a relaxation reaches the entry, it is queued with rank 2
+        as a lower bound of their ranks.
+
+        Arguments:
+            node {int} -- Index of the entry to expand
+
+        Returns:
+            list -- Indices of the added entries
+        """
+        offsets, senders = self._first_choices
+        node_id = self._node_ids[node]
+        start = offsets[node_id]
+        end = offsets[node_id + 1]
+        need = self._max_hop - self._entry_levels[node] - 1
+        path = self._ancestors[node]
+        added_children = []
+        for child_id in senders[start:end].tolist():
             if child_id in path:
                 continue
-            if child_id in children_ids:
+            if self._prune and need > 0 and not self._has_room(child_id, path, need):
+                self._pruned += 1
                 continue
-            rank = self._get_node_rank(node.data, child_id, target_address)
-            if rank <= max_rank:
-                added_children.append(self._add_child(node, child_id, rank))
+            added_children.append(self._add_entry(child_id, node, 1))
+
+        if self._graph.degree(node_id) > end - start:
+            self._pending[node] = (None, 1)
+            heapq.heappush(self._worklist, (2, self._entry_levels[node], node))
         return added_children
 
-    def _build_sender_set(self, node_id_list, current_hop_count):
-        # needs to search breadth first, otherwise some nodes can be skipped
-        if current_hop_count < 1:
-            return
-        next_node_ids = []
-        # add current nodes
-        for node_id in node_id_list:
-            if node_id in self._sender_set:
-                continue
-            self._sender_set.add(node_id)
+    def _has_room(self, node_id, path, need):
+        """Check if a simple path of need hops can leave a node
+
+        Every level up to the intercepted hop lies in the sender set, so the
+        search is limited to sender set nodes that are not already on the path.
+        The sender set of the horizon is used, it holds the sender set of every
+        hop the tree can be extended to.
 
-            next_node_ids.extend(self._nx_graph.neighbors(node_id))
-        # process next level
-        self._build_sender_set(next_node_ids, current_hop_count - 1)
+        Arguments:
+            node_id {int} -- ID of the node the path starts at
+            path {frozenset} -- IDs of the nodes already on the routing path
+            need {int} -- Number of hops that are still required
 
-    def _add_child(self, node, child, node_rank):
+        Returns:
+            bool -- False if fewer than need nodes can be reached
+        """
+        visited = set([node_id])
+        process_nodes = [node_id]
+        found = 0
+        while len(process_nodes) > 0:
+            next_nodes = []
+            for current_id in process_nodes:
+                for next_id in self._graph.neighbors(current_id):
+                    if next_id in visited or next_id in path or \
+                            next_id not in self._room_set:
+                        continue
+                    found += 1
+                    if found >= need:
+                        return True
+                    visited.add(next_id)
+                    next_nodes.append(next_id)
+            process_nodes = next_nodes
+        return False
+
+    def _elapsed(self):
+        # seconds of the build and every extension so far
+        if self._start_time is None:
+            return self._spent_time
+        return self._spent_time + time.time() - self._start_time
+
+    def _stop_clock(self):
+        self._spent_time = self._elapsed()
+        self._start_time = None
+
+    def _over_budget(self):
+        if self._max_nodes > 0 and len(self._node_ids) >= self._max_nodes:
+            return True
+        if self._max_memory > 0 and self._memory >= self._max_memory:
+            return True
+        if self._max_time > 0 and self._elapsed() >= self._max_time:
+            return True
+        return False
+
+    def _add_entry(self, node_id, parent, node_rank):
         '''
         Add new data element to the tree
-        :param node: parent node
-        :param child: new object to be added
-        :return: new node added to the tree
+        :param node_id: ID of the node the entry represents
+        :param parent: index of the parent entry, -1 for the root
+        :param node_rank: rank of the parent in the node's routing choices
+        :return: index of the new entry
         '''
-        level = node.level + 1
-        new_entry = RoutingTree._Entry(child, level, node, node_rank)
-        node.children.append(new_entry)
+        entry = len(self._node_ids)
+        if parent < 0:
+            level = 0
+            ancestors = frozenset([node_id])
+        else:
+            level = self._entry_levels[parent] + 1
+            ancestors = self._ancestors[parent] | frozenset([node_id])
+        self._node_ids.append(node_id)
+        self._parents.append(parent)
+        self._entry_levels.append(level)
+        self._ranks.append(node_rank)
+        self._ancestors.append(ancestors)
+        # four array slots plus the ancestor set, the rest is shared
+        self._memory += 16 + sys.getsizeof(ancestors)
+        self._children_index = None
         if level not in self._levels:
-            self._levels[level] = []
-        self._levels[level].append(new_entry)
-        return new_entry
-
-    class _Entry(object):
-        '''
-        Reprents a tree structure
-        '''
-
-        def __init__(self, data, level, parent=None, node_rank=1):
-            self.data = data
-            self.children = []
-            self.level = level
-            self.parent = parent
-            self.rank = node_rank
-
-        def get_path(self):
-            path = []
-            walker = self
-            while walker is not None:
-                path.insert(0, walker.data)
-                walker = walker.parent
-            return path
-
-        def get_child_ids(self):
-            child_ids = []
-            for child in self.children:
-                child_ids.append(child.data)
-            return child_ids
-
-        def __repr__(self):
-            return str(self.data)
+            self._levels[level] = array('i')
+        self._levels[level].append(entry)
+        return entry
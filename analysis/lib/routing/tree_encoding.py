@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+'''
+Updated on March, 2018
+@author: Todd Baumeister <tbaumeist@gmail.com>
+
+Compact encoding of routing trees.
+
+A tree is stored as three parallel int32 arrays in entry order, parents come
+before their children:
+    node ids, parent offsets (entry - parent entry, 0 for the root), ranks
+The arrays are concatenated little endian, zlib compressed and base64 encoded.
+'''
+import base64
+import zlib
+import numpy
+
+
+def encode_tree(node_ids, parent_offsets, ranks):
+    """Encode the arrays of a tree
+
+    Arguments:
+        node_ids {ndarray} -- Node id of each entry
+        parent_offsets {ndarray} -- Distance of each entry to its parent entry
+        ranks {ndarray} -- Routing choice rank of each entry
+
+    Returns:
+        str -- Base64 string of the tree
+    """
+    values = numpy.concatenate((node_ids, parent_offsets, ranks)).astype('<i4')
+    return base64.b64encode(zlib.compress(values.tobytes(), 6)).decode('ascii')
+
+
+def decode_tree(encoded):
+    """Decode a tree into its arrays
+
+    Arguments:
+        encoded {str} -- Base64 string, see encode_tree
+
+    Returns:
+        tuple -- (node_ids, parent_offsets, ranks) int32 ndarrays
+    """
+    if not encoded:
+        empty = numpy.array([], dtype=numpy.int32)
+        return empty, empty, empty
+    values = numpy.frombuffer(zlib.decompress(base64.b64decode(encoded)), dtype='<i4')
+    if len(values) % 3 != 0:
+        raise Exception('Invalid routing tree encoding')
+    size = len(values) // 3
+    return values[:size], values[size:2 * size], values[2 * size:]
+
+
+def to_bracket(node_ids, parent_offsets, ranks):
+    """Bracket representation of a tree, children in entry order
+
+    Arguments:
+        node_ids {list} -- Node id of each entry
+        parent_offsets {list} -- Distance of each entry to its parent entry
+        ranks {list} -- Routing choice rank of each entry
+
+    Returns:
+        string -- Bracket string, e.g. (13--0(5--1(6--2)))
+    """
+    if len(node_ids) == 0:
+        return ''
+    children = [[] for _ in range(len(node_ids))]
+    for entry in range(1, len(node_ids)):
+        children[entry - parent_offsets[entry]].append(entry)
+
+    # depth first, a negative entry closes the bracket of ~entry
+    parts = []
+    stack = [0]
+    while stack:
+        entry = stack.pop()
+        if entry < 0:
+            parts.append(')')
+            continue
+        parts.append('({}--{}'.format(node_ids[entry], ranks[entry]))
+        stack.append(~entry)
+        stack.extend(reversed(children[entry]))
+    return ''.join(parts)
+
+
+def encoded_to_bracket(encoded):
+    """Bracket representation of an encoded tree
+
+    Arguments:
+        encoded {str} -- Base64 string, see encode_tree
+
+    Returns:
+        string -- Bracket string of the tree
+    """
+    return to_bracket(*[values.tolist() for values in decode_tree(encoded)])
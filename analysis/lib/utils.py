@@ -88,6 +88,19 @@ def percent(selected, total):
     return selected / float(total)
 
 
+def anonymity_set_calculated(data_object, include_partial=False):
+    '''
+    Check if a route has a calculated anonymity set
+    :param data_object: route JSON object
+    :param include_partial: accept anonymity sets from routing trees that ran
+        out of budget
+    :return: True if the anonymity set can be used
+    '''
+    if 'anonymity_set' not in data_object or not data_object['anonymity_set']['calculated']:
+        return False
+    return include_partial or not data_object['anonymity_set'].get('partial', False)
+
+
 def timeit(method):
     ''' Logs a method call time '''
     @functools.wraps(method)
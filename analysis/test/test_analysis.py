@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+'''
+Updated on March, 2018
+@author: Todd Baumeister <tbaumeist@gmail.com>
+
+Unit test for running the analysis of several experiments
+'''
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from analysis import Manager
+from .utils import get_gml_path_100, get_route_json_path_100
+
+
+class TestAnalysis(unittest.TestCase):
+    '''
+    Test the thread budget of the experiment analysis
+    '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write_experiment(self, experiment_id):
+        '''
+        Experiment directory with the size 100 graph, its routes are written twice
+        with the node ids divisible by 5 + experiment_id and then 6 + experiment_id
+        as adversaries
+        '''
+        base_path = os.path.join(self.directory, str(experiment_id), '0')
+        os.makedirs(os.path.join(base_path, 'graphs'))
+        shutil.copy(get_gml_path_100(), os.path.join(base_path, 'graphs', 'graph_0.gml'))
+        with open(os.path.join(base_path, 'graphs', 'routing_choice.stats'), 'w') as output:
+            output.write(json.dumps({'cycle': 1, 'churn_count': 0, 'routing_choice_frequency': [
+                {'choice': 1, 'frequency': 80}, {'choice': 2, 'frequency': 15},
+                {'choice': 3, 'frequency': 5}]}) + '\n')
+        config_file = os.path.join(base_path, 'config.json')
+        with open(config_file, 'w') as output:
+            output.write(json.dumps({'router_type': 'DHTRouterGreedy', 'look_ahead': 1,
+                                     'router_randomness': 0.1, 'size': 100, 'repeat': 0}))
+
+        with open(get_route_json_path_100(), 'r') as route_input:
+            routes = [json.loads(line) for line in route_input]
+        with open(os.path.join(base_path, 'routing.json'), 'w') as output:
+            route_id = 1
+            for modulus in [5 + experiment_id, 6 + experiment_id]:
+                for route in routes:
+                    route['id'] = route_id
+                    route_id += 1
+                    for node in route['routing_path']['path'][1:]:
+                        node['is_adversary'] = node['id'] % modulus == 0
+                    output.write(json.dumps(route) + '\n')
+        return {'config': config_file, 'experiment': config_file, 'id': experiment_id}
+
+    def _run(self, experiments, thread_count):
+        '''
+        Analyze the experiments, return the sender sets and metric data of each
+        and remove them again
+        '''
+        manager = Manager()
+        manager._experiement_configurations = experiments
+        manager.run_analysis(len(experiments), thread_count, False, {'chunk_size': 2})
+
+        results = []
+        for exp_files in experiments:
+            base_path = os.path.dirname(exp_files['config'])
+            routing_file = os.path.join(base_path, 'sender_set.routing.json')
+            metric_file = os.path.join(base_path, 'metrics.json')
+            with open(routing_file, 'r') as routing_input:
+                routes = [json.loads(line) for line in routing_input]
+            with open(metric_file, 'r') as metric_input:
+                metrics = json.loads(metric_input.read())['data']
+            os.remove(routing_file)
+            os.remove(metric_file)
+            results.append((routes, metrics))
+        return results
+
+    def test_processes(self):
+        experiments = [self._write_experiment(0), self._write_experiment(1)]
+        serial = self._run(experiments, 1)
+        # two experiments at a time, each with two sender set processes
+        parallel = self._run(experiments, 4)
+
+        for (routes, metrics), (serial_routes, serial_metrics) in zip(parallel, serial):
+            self.assertTrue(len(routes) == 12)
+            self.assertTrue(any(route['anonymity_set']['calculated'] for route in routes))
+            self.assertTrue(routes == serial_routes)
+            self.assertTrue(metrics == serial_metrics)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+'''
+Updated on March, 2018
+@author: Todd Baumeister <tbaumeist@gmail.com>
+
+Unit test for the metric data frames
+'''
+import unittest
+import numpy
+import pandas
+
+from lib.actions import metric_base
+from lib.actions.metric_base import MetricBase
+from lib.actions.anonymity_accuracy_metrics import AnonymityAccuracyMetrics, AnonymityHitAtHop
+
+
+class TestMetricBase(unittest.TestCase):
+    '''
+    Test the column buffers of the metric data frames
+    '''
+
+    def _rows(self):
+        return [[1, 0.5, 'a', True, None],
+                [2, numpy.nan, 'b', False],
+                [3, 2.5, None],
+                [4]]
+
+    def _check(self):
+        metric = MetricBase()
+        columns = ['int', 'float', 'string', 'bool', 'none']
+        for column in columns:
+            metric.add_column(column)
+        rows = self._rows()
+        for row in rows:
+            metric.add_row(row)
+        metric.on_stop()
+        # same values and types as a frame built from the padded rows
+        expected = pandas.DataFrame(
+            [row + [numpy.nan] * (len(columns) - len(row)) for row in rows],
+            columns=columns)
+        self.assertTrue(list(metric.data_frame.dtypes) == list(expected.dtypes))
+        self.assertTrue(metric.to_csv() == expected.to_csv(index=False))
+
+    def test_columns(self):
+        self._check()
+
+    def test_row_chunks(self):
+        chunk_size = metric_base.ROW_CHUNK_SIZE
+        try:
+            metric_base.ROW_CHUNK_SIZE = 1
+            self._check()
+        finally:
+            metric_base.ROW_CHUNK_SIZE = chunk_size
+
+    def test_late_column(self):
+        metric = MetricBase()
+        metric.add_column('cycle')
+        metric.add_row([1])
+        metric.on_stop()
+        metric.add_column('count')
+        metric.add_row([2, 5])
+        metric.on_stop()
+        self.assertTrue(metric.data_frame['cycle'].tolist() == [1, 2])
+        self.assertTrue(numpy.isnan(metric.data_frame['count'][0]))
+        self.assertTrue(metric.data_frame['count'][1] == 5)
+        with self.assertRaises(Exception):
+            metric.add_row([1, 2, 3])
+
+    def test_merge(self):
+        metric = MetricBase()
+        metric.add_column('cycle')
+        metric.add_column('count')
+        metric.add_row([1, 5])
+        metric.on_stop()
+        metric.add_row([2, 6])
+        other = MetricBase()
+        other.add_column('extra')
+        other.add_column('cycle')
+        other.add_row([0.5, 3])
+        other.on_stop()
+        metric.merge(other)
+        # columns are matched by name, the rows waiting to be added come first
+        self.assertTrue(list(metric.data_frame.columns) == ['cycle', 'count', 'extra'])
+        self.assertTrue(metric.data_frame['cycle'].tolist() == [1, 2, 3])
+        self.assertTrue(metric.data_frame['count'][:2].tolist() == [5, 6])
+        self.assertTrue(numpy.isnan(metric.data_frame['count'][2]))
+        self.assertTrue(metric.data_frame['extra'][2] == 0.5)
+
+    def _hit_at_hop(self, rows):
+        accuracy = AnonymityAccuracyMetrics()
+        for column in ['hop', 'top_rank_hit', 'best_entropy_hit',
+                       'best_entropy_actual_hit', 'rank_missed']:
+            accuracy.add_column(column)
+        for row in rows:
+            accuracy.add_row(row)
+        accuracy.on_stop()
+        hit_at_hop = AnonymityHitAtHop(accuracy)
+        hit_at_hop.on_stop()
+        return accuracy, hit_at_hop
+
+    def test_merge_derived(self):
+        rows = [[1, 1, 0, 1, 0], [2, 0, 1, 0, 1], [1, 1, 1, 0, 0]]
+        accuracy, hit_at_hop = self._hit_at_hop(rows[:2])
+        other_accuracy, other_hit_at_hop = self._hit_at_hop(rows[2:])
+        # the source metric is merged first, like the metric manager merger does
+        accuracy.merge(other_accuracy)
+        hit_at_hop.merge(other_hit_at_hop)
+        _, expected = self._hit_at_hop(rows)
+        self.assertTrue(hit_at_hop.to_csv() == expected.to_csv())
+        self.assertTrue(hit_at_hop.data_frame['hop'].tolist() == [1, 2])
+        self.assertTrue(hit_at_hop.data_frame['hop_count'].tolist() == [2, 1])
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+'''
+Updated on March, 2018
+@author: Todd Baumeister <tbaumeist@gmail.com>
+
+Unit test for the route prediction functions
+'''
+import unittest
+
+from lib.routing.compact_graph import CompactGraph
+from lib.routing.route_prediction import rank_greedy, rank_greedy_2_hop, rank_greedy_vectorized
+from lib.routing.route_prediction import rank_greedy_batch, RankGreedyKHop, rank_table
+from lib.routing.route_prediction import first_choice_senders
+from .utils import get_nx_graphs_100, get_nx_graphs_100_structured
+
+
+class TestRoutePrediction(unittest.TestCase):
+    '''
+    Test the ranking functions
+    '''
+
+    def test_vectorized_greedy(self):
+        nx_graph = get_nx_graphs_100()[0]
+        compact = CompactGraph.from_nx_graph(nx_graph)
+        targets = [0.0, 0.05, 0.5, 0.99, nx_graph.node[10]['location']]
+        for target in targets:
+            for node_id in nx_graph.nodes():
+                expected = rank_greedy(node_id, target, nx_graph)
+                self.assertTrue(expected == rank_greedy_vectorized(
+                    node_id, target, compact))
+                self.assertTrue(expected == rank_greedy_vectorized(
+                    node_id, target, nx_graph))
+
+    def test_batch_greedy(self):
+        nx_graph = get_nx_graphs_100()[0]
+        compact = CompactGraph.from_nx_graph(nx_graph)
+        node_ids = list(nx_graph.nodes()) * 2
+        targets = [0.3] * nx_graph.number_of_nodes() + \
+            [nx_graph.node[12]['location']] * nx_graph.number_of_nodes()
+        ranked = rank_greedy_batch(node_ids, targets, compact)
+        self.assertTrue(len(ranked) == len(node_ids))
+        for node_id, target, ranked_nodes in zip(node_ids, targets, ranked):
+            self.assertTrue(ranked_nodes == rank_greedy(node_id, target, nx_graph))
+
+        self.assertTrue(rank_greedy_batch([], 0.3, compact) == [])
+        self.assertTrue(rank_greedy_batch([4, 5], 0.3, compact) ==
+                        [rank_greedy(4, 0.3, nx_graph), rank_greedy(5, 0.3, nx_graph)])
+
+    def test_k_hop_greedy(self):
+        nx_graph = get_nx_graphs_100()[0]
+        compact = CompactGraph.from_nx_graph(nx_graph)
+        one_hop = RankGreedyKHop(1)
+        two_hop = RankGreedyKHop(2)
+        for target in [0.0, 0.5, 0.99, nx_graph.node[10]['location']]:
+            for node_id in nx_graph.nodes():
+                self.assertTrue(one_hop(node_id, target, compact) ==
+                                rank_greedy(node_id, target, nx_graph))
+                self.assertTrue(two_hop(node_id, target, compact) ==
+                                rank_greedy_2_hop(node_id, target, nx_graph))
+
+        three_hop = RankGreedyKHop(3)
+        reach = three_hop.reach_locations(nx_graph, 0)
+        self.assertTrue(list(reach) == sorted(reach))
+        self.assertTrue(nx_graph.node[0]['location'] in reach)
+        self.assertTrue(three_hop.best_distance(
+            compact, 0, nx_graph.node[0]['location']) == 0.0)
+        with self.assertRaises(Exception):
+            RankGreedyKHop(0)
+
+    def test_k_hop_greedy_node_ids(self):
+        # networkx graphs keep their node ids, not the compact indices
+        nx_graph = get_nx_graphs_100_structured()[0]
+        two_hop = RankGreedyKHop(2)
+        for target in [0.05, 0.5]:
+            for node_id in nx_graph.nodes():
+                self.assertTrue(two_hop(node_id, target, nx_graph) ==
+                                rank_greedy_2_hop(node_id, target, nx_graph))
+
+    def test_rank_table(self):
+        nx_graph = get_nx_graphs_100()[0]
+        compact = CompactGraph.from_nx_graph(nx_graph)
+        for edge in range(len(compact.indices)):
+            reverse = compact.reverse_edges[edge]
+            self.assertTrue(compact.sources[reverse] == compact.indices[edge])
+            self.assertTrue(compact.indices[reverse] == compact.sources[edge])
+
+        for look_ahead, rank_alg in [(1, rank_greedy), (2, rank_greedy_2_hop)]:
+            for target in [0.0, 0.5, nx_graph.node[10]['location']]:
+                ranks = rank_table(compact, target, look_ahead)
+                offsets, senders = first_choice_senders(compact, ranks)
+                for node_id in nx_graph.nodes():
+                    start = compact.offsets[node_id]
+                    end = compact.offsets[node_id + 1]
+                    expected = {}
+                    for index, nodes in enumerate(rank_alg(node_id, target, nx_graph)):
+                        for neighbor_id in nodes:
+                            expected[neighbor_id] = index + 1
+                    self.assertTrue(dict(zip(compact.indices[start:end].tolist(),
+                                             ranks[start:end].tolist())) == expected)
+                    first_senders = [i for i in nx_graph.neighbors(node_id)
+                                     if node_id in rank_alg(i, target, nx_graph)[0]]
+                    self.assertTrue(senders[offsets[node_id]:offsets[node_id + 1]].tolist() ==
+                                    first_senders)
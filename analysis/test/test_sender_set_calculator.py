@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+'''
+Updated on March, 2018
+@author: Todd Baumeister <tbaumeist@gmail.com>
+
+Unit test for the sender set calculator
+'''
+import json
+import os
+import re
+import shutil
+import tempfile
+import unittest
+import networkx as nx
+
+from lib.actions.experiment_config import ExperimentConfig
+from lib.actions.graph_manager import GraphManager
+from lib.actions.routing_choice_metric import RoutingChoiceMetric
+from lib.actions.sender_set_calculator import SenderSetCalculator
+from lib.file.file_reader import JSONFileReader
+from lib.routing import tree_encoding
+from .utils import get_gml_path_100, get_gml_path_100_structured, get_nx_graphs_100
+
+
+class TestSenderSetCalculator(unittest.TestCase):
+    '''
+    Test the anonymity sets of the SenderSetCalculator
+    '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write_graph(self, name, id_offset, source=None):
+        '''
+        Copy of a test graph, the structured one by default, with id_offset
+        added to every node id
+        '''
+        with open(source or get_gml_path_100_structured(), 'r') as graph_input:
+            gml = graph_input.read()
+        gml = re.sub(r'(\b(?:id|source|target) )(\d+)',
+                     lambda match: match.group(1) + str(int(match.group(2)) + id_offset), gml)
+        graph_file = os.path.join(self.directory, name)
+        with open(graph_file, 'w') as graph_output:
+            graph_output.write(gml)
+        return graph_file
+
+    def _route(self, route_id, path, adversaries, target):
+        '''
+        Route JSON object with the given node ids as routing path
+        '''
+        nodes = [{'id': node_id, 'hop': hop, 'is_adversary': node_id in adversaries}
+                 for hop, node_id in enumerate(path)]
+        return {'id': route_id, 'cycle': 200000, 'source_node': path[0],
+                'destination_node': path[-1], 'target': target,
+                'routing_path': {'path': nodes}}
+
+    def _calculate(self, graph_file, routes, **kwargs):
+        '''
+        Run the calculator over the routes, return the output route objects
+        '''
+        graph_manager = GraphManager()
+        graph_manager.process(graph_file)
+        graph_manager.on_stop()
+        experiment_config = ExperimentConfig()
+        experiment_config.process({'router_type': 'DHTRouterGreedy', 'look_ahead': 1,
+                                   'router_randomness': 0.1, 'size': 100})
+        experiment_config.on_stop()
+        routing_choice = RoutingChoiceMetric()
+        routing_choice.process({'cycle': 1, 'churn_count': 0, 'routing_choice_frequency': [
+            {'choice': 1, 'frequency': 80}, {'choice': 2, 'frequency': 15},
+            {'choice': 3, 'frequency': 5}]})
+        routing_choice.on_stop()
+
+        route_file = os.path.join(self.directory, 'routing.json')
+        with open(route_file, 'w') as output:
+            for route in routes:
+                output.write(json.dumps(route) + '\n')
+        calculator = SenderSetCalculator(
+            graph_manager, experiment_config, routing_choice, **kwargs)
+        JSONFileReader([calculator]).process(route_file)
+        with open(calculator.get_output_file_path(), 'r') as output:
+            return [json.loads(line) for line in output]
+
+    def _check_distribution(self, distribution, expected, id_offset):
+        '''
+        Compare two sender distributions, the expected one with id_offset added to its ids
+        '''
+        expected = dict((int(node_id) + id_offset, p) for node_id, p in expected.items())
+        distribution = dict((int(node_id), p) for node_id, p in distribution.items())
+        self.assertTrue(sorted(distribution.keys()) == sorted(expected.keys()))
+        for node_id, probability in expected.items():
+            self.assertAlmostEqual(distribution[node_id], probability)
+
+    def _tree_edges(self, encoded, id_offset):
+        '''
+        Sorted (parent id, node id, rank) entries of an encoded tree
+        '''
+        node_ids, parent_offsets, ranks = [
+            values.tolist() for values in tree_encoding.decode_tree(encoded)]
+        node_ids = [node_id + id_offset for node_id in node_ids]
+        return sorted((node_ids[entry - parent_offsets[entry]], node_ids[entry], ranks[entry])
+                      for entry in range(len(node_ids)))
+
+    def test_structured_graph(self):
+        # node ids 100 to 199, the compact graph uses indices 0 to 99
+        path = [162, 161, 160, 110, 109, 108, 107, 104, 105]
+        routes = [self._route(1, path, [105], .05)]
+        dense_routes = [self._route(1, [i - 100 for i in path], [5], .05)]
+
+        result = self._calculate(self._write_graph('structured.gml', 0), routes)
+        dense_result = self._calculate(self._write_graph('dense.gml', -100), dense_routes)
+
+        a_data = result[0]['anonymity_set']
+        dense_data = dense_result[0]['anonymity_set']
+        self.assertTrue(a_data['calculated'])
+        self.assertTrue(162 in a_data['full_set']['nodes'])
+        self.assertTrue(a_data['full_set']['nodes'] ==
+                        [i + 100 for i in dense_data['full_set']['nodes']])
+        for name in ['probability_set', 'probability_set_actual']:
+            self._check_distribution(a_data[name], dense_data[name], 100)
+        # sibling order follows the neighbour order of networkx, compare the edges
+        self.assertTrue(self._tree_edges(a_data['tree_encoded'], 0) ==
+                        self._tree_edges(dense_data['tree_encoded'], 100))
+
+    def test_collusion_revisit(self):
+        graph_file = self._write_graph('size_100.gml', 0, get_gml_path_100())
+        routes = [self._route(1, [98, 42, 0, 83, 0, 81], [83, 81], .5),
+                  # the message passes 5 and 67 again after the first interception by 8
+                  self._route(2, [5, 67, 8, 67, 5, 76], [8, 76], .5),
+                  self._route(3, [5, 67, 8, 67, 8, 67], [8], .5)]
+        single = self._calculate(graph_file, routes)
+        colluding = self._calculate(graph_file, routes, collusion=True)
+
+        # the sender is within 4 hops of 0 without passing 81
+        a_data = colluding[0]['anonymity_set']
+        single_data = single[0]['anonymity_set']
+        self.assertTrue(a_data['colluding'] == 2)
+        nx_graph = get_nx_graphs_100()[0]
+        nx_graph.remove_node(81)
+        reachable = nx.single_source_shortest_path_length(nx_graph, 0, cutoff=4)
+        expected = [i for i in single_data['full_set']['nodes'] if i in reachable]
+        self.assertTrue(a_data['full_set']['nodes'] == expected)
+        self.assertTrue(98 in expected)
+        self.assertTrue(len(expected) < single_data['full_set']['length'])
+        for name in ['probability_set', 'probability_set_actual']:
+            total = sum(p for i, p in single_data[name].items() if int(i) in reachable)
+            expected = dict((i, p / total) for i, p in single_data[name].items()
+                            if int(i) in reachable)
+            self._check_distribution(a_data[name], expected, 0)
+
+        a_data = colluding[1]['anonymity_set']
+        self.assertTrue(a_data['colluding'] == 2)
+        self.assertTrue(5 in a_data['full_set']['nodes'])
+        self.assertTrue(a_data['probability_set_actual']['5'] > 0)
+
+        # an adversary seeing the message again adds nothing
+        self.assertTrue(colluding[2]['anonymity_set']['colluding'] == 2)
+        for name in ['full_set', 'probability_set_actual']:
+            self.assertTrue(colluding[2]['anonymity_set'][name] ==
+                            single[2]['anonymity_set'][name])
+
+    def test_partial(self):
+        graph_file = self._write_graph('size_100.gml', 0, get_gml_path_100())
+        path = [67, 98, 56, 12, 19, 45, 15, 18, 60, 93]
+        routes = [self._route(1, path, [93], .5)]
+        for markov_chain in [True, False]:
+            complete = self._calculate(graph_file, routes, markov_chain=markov_chain)
+            partial = self._calculate(graph_file, routes, markov_chain=markov_chain,
+                                      max_tree_nodes=20)
+            a_data = partial[0]['anonymity_set']
+            self.assertTrue(a_data['partial'])
+            self.assertTrue(a_data['explored']['height'] <= 9)
+            # the sender set is complete, the routing paths are not used
+            full_set = complete[0]['anonymity_set']['full_set']
+            self.assertTrue(a_data['full_set'] == full_set)
+            self.assertTrue(a_data['ranked_set'] == {'1': full_set['nodes']})
+            for name in ['probability_set', 'probability_set_top_rank']:
+                self.assertTrue(a_data[name] == a_data['probability_set_sender_set'])
+            if markov_chain:
+                self.assertTrue(a_data['probability_set_actual'] ==
+                                complete[0]['anonymity_set']['probability_set_actual'])
+            else:
+                self.assertTrue(a_data['probability_set_actual'] ==
+                                a_data['probability_set_sender_set'])
+
+    def test_tree_cache(self):
+        # deeper and shallower interceptions of the same adversary and previous node
+        graph_file = self._write_graph('size_100.gml', 0, get_gml_path_100())
+        prefix = [67, 98, 56, 12, 19, 45, 15, 18]
+        routes = [self._route(route_id, prefix[:hop - 1] + [60, 93], [93], .5)
+                  for route_id, hop in enumerate([6, 3, 8, 4, 8, 7, 2], 1)]
+        expected = self._calculate(graph_file, routes, tree_cache_size=0)
+        for kwargs in [{}, {'sender_set_batch_size': 4}]:
+            result = self._calculate(graph_file, routes, **kwargs)
+            self.assertTrue(result == expected)
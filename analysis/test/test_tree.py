@@ -7,8 +7,17 @@ Unit test for routing tree
 '''
 import unittest
 
+from lib.routing import tree as tree_module
 from lib.routing.tree import RoutingTree
-from lib.routing.route_prediction import rank_greedy, rank_greedy_2_hop
+from lib.routing.compact_graph import CompactGraph
+import networkx as nx
+from lib.routing.cache import RankCache, RankTableCache, SenderSetCache
+from lib.routing.route_prediction import rank_greedy, rank_greedy_2_hop, rank_table
+from lib.routing.estimator import estimate_sender_distribution
+from lib.routing.markov import transition_matrix, sender_distribution_markov
+from lib.routing.distance_matrix import DistanceMatrix
+from lib.routing.tree_encoding import decode_tree, encoded_to_bracket
+import numpy
 from .utils import get_nx_graphs, get_nx_graphs_100, list_equals, get_nx_graphs_100_structured
 
 
@@ -27,6 +36,27 @@ class TestTree(unittest.TestCase):
         self.assertTrue(162 in ranked[8])
 
 
+    def test_structured_compact_graph(self):
+        nx_graph = get_nx_graphs_100_structured()[0]
+        compact = CompactGraph.from_nx_graph(nx_graph)
+        self.assertTrue(compact.relabeled)
+        for node_id in nx_graph.nodes():
+            index = compact.node_index(node_id)
+            self.assertTrue(compact.to_node_ids([index]) == [node_id])
+            self.assertTrue(compact.to_node_ids(compact.neighbors(index)) ==
+                            list(nx_graph.neighbors(node_id)))
+            self.assertTrue(nx_graph.node[node_id]['location'] == compact.location(index))
+        with self.assertRaises(Exception):
+            compact.node_index(0)
+
+        tree = RoutingTree(nx_graph, rank_greedy)
+        tree.build(105, 104, 8, .05)
+        compact_tree = RoutingTree(compact, rank_greedy)
+        compact_tree.build(compact.node_index(105), compact.node_index(104), 8, .05)
+        self.assertTrue(tree.to_bracket() == compact_tree.to_bracket(compact.node_ids))
+        self.assertTrue(tree.get_sender_set() ==
+                        compact.to_node_ids(compact_tree.get_sender_set()))
+
     def test_works(self):
         nx_graph = get_nx_graphs()[0]
         tree = RoutingTree(nx_graph, rank_greedy)
@@ -92,6 +122,293 @@ class TestTree(unittest.TestCase):
         self.assertTrue(round(distro[6], 3) == 0.333)
         self.assertTrue(round(distro[10], 3) == 0.333)
 
+    def test_rank_outside_tree(self):
+        nx_graph = get_nx_graphs()[0]
+        tree = RoutingTree(nx_graph, rank_greedy)
+        tree.build(4, 10, 6, 0.2387)
+
+        ranked = tree.get_sender_set_rank()
+        # 11 is reached by paths of rank 11 and 12, the sender set nodes
+        # outside the tree rank after the largest path rank
+        self.assertTrue(sorted(ranked.keys()) == [11, 12, 13])
+        self.assertTrue(list_equals([9, 11], ranked[11]))
+        self.assertTrue(list_equals([11], ranked[12]))
+        self.assertTrue(list_equals([0, 1, 2, 3, 5, 6, 7, 8, 10, 12, 13], ranked[13]))
+
+    def test_compact_graph(self):
+        nx_graph = get_nx_graphs_100()[0]
+        compact = CompactGraph.from_nx_graph(nx_graph)
+        self.assertTrue(compact.number_of_nodes() == nx_graph.number_of_nodes())
+        self.assertTrue(compact.number_of_edges() == nx_graph.number_of_edges())
+        for node_id in nx_graph.nodes():
+            self.assertTrue(list(nx_graph.neighbors(node_id)) == compact.neighbors(node_id))
+            self.assertTrue(nx_graph.node[node_id]['location'] == compact.location(node_id))
+
+        for rank_alg in [rank_greedy, rank_greedy_2_hop]:
+            for node_id in nx_graph.nodes():
+                self.assertTrue(rank_alg(node_id, 0.3, nx_graph) ==
+                                rank_alg(node_id, 0.3, compact))
+
+        tree = RoutingTree(nx_graph, rank_greedy)
+        tree.build(13, 5, 4, 0.29)
+        compact_tree = RoutingTree(compact, rank_greedy)
+        compact_tree.build(13, 5, 4, 0.29)
+        self.assertTrue(tree.to_bracket() == compact_tree.to_bracket())
+        self.assertTrue(tree.get_sender_set_rank() == compact_tree.get_sender_set_rank())
+
+    def test_shared_rank_cache(self):
+        nx_graph = get_nx_graphs()[0]
+        rank_cache = RankCache(nx_graph, rank_greedy, max_size=4)
+        tree = RoutingTree(nx_graph, rank_greedy)
+        shared_tree = RoutingTree(nx_graph, rank_greedy, rank_cache=rank_cache)
+        for _ in range(2):
+            tree.build(13, 5, 4, 0.29)
+            shared_tree.build(13, 5, 4, 0.29)
+            self.assertTrue(tree.to_bracket() == shared_tree.to_bracket())
+        self.assertTrue(rank_cache.hits > 0)
+        self.assertTrue(len(rank_cache) <= 4)
+
+        self.assertTrue(rank_cache.get_ranks(11, 0.55) == {8: 1, 3: 2, 0: 3})
+
+    def test_rank_table_cache(self):
+        nx_graph = get_nx_graphs_100()[0]
+        compact = CompactGraph.from_nx_graph(nx_graph)
+        for rank_alg, look_ahead in [(rank_greedy, 1), (rank_greedy_2_hop, 2)]:
+            rank_tables = RankTableCache(compact, look_ahead, max_size=2)
+            tree = RoutingTree(compact, rank_alg)
+            table_tree = RoutingTree(compact, rank_alg, rank_table_cache=rank_tables)
+            for _ in range(2):
+                tree.build(13, 5, 4, 0.29)
+                table_tree.build(13, 5, 4, 0.29)
+                self.assertTrue(tree.to_bracket() == table_tree.to_bracket())
+            self.assertTrue(rank_tables.misses == 1 and len(rank_tables) == 1)
+
+        with self.assertRaises(Exception):
+            RoutingTree(nx_graph, rank_greedy, rank_table_cache=rank_tables).build(
+                13, 5, 4, 0.29)
+
+    def test_dead_end(self):
+        nx_graph = get_nx_graphs()[0]
+        line = nx_graph.subgraph([13, 5, 4]).copy()
+        # no routing choices left before reaching max hop, stop with a partial tree
+        tree = RoutingTree(line, rank_greedy, prune=False)
+        tree.build(13, 5, 6, 0.29)
+        self.assertTrue(tree.get_height() == 3)
+        self.assertTrue(list_equals(tree.get_data_at_level(2), [4]))
+        # the branch can never reach the intercepted hop
+        pruned_tree = RoutingTree(line, rank_greedy)
+        pruned_tree.build(13, 5, 6, 0.29)
+        self.assertTrue(pruned_tree.get_height() == 2)
+        self.assertTrue(pruned_tree.get_build_stats()['pruned'] == 1)
+
+    def test_budget(self):
+        nx_graph = get_nx_graphs_100()[0]
+        tree = RoutingTree(nx_graph, rank_greedy)
+        tree.build(13, 5, 6, 0.29)
+        self.assertFalse(tree.is_partial())
+        full_size = tree.get_build_stats()['nodes']
+
+        budget_tree = RoutingTree(nx_graph, rank_greedy, max_nodes=10)
+        budget_tree.build(13, 5, 6, 0.29)
+        self.assertTrue(budget_tree.is_partial())
+        stats = budget_tree.get_build_stats()
+        self.assertTrue(10 <= stats['nodes'] < full_size)
+        self.assertTrue(list_equals(budget_tree.get_sender_set(), tree.get_sender_set()))
+        self.assertTrue(round(sum(budget_tree.get_sender_set_distribution(
+            budget_tree.distro_rank_exponetial_backoff).values()), 5) == 1.0)
+
+        budget_tree = RoutingTree(nx_graph, rank_greedy, max_memory=1)
+        budget_tree.build(13, 5, 6, 0.29)
+        self.assertTrue(budget_tree.is_partial())
+
+    def test_budget_time(self):
+        # each reading of the clock takes a second
+        class Clock(object):
+            now = 0.0
+
+            def time(self):
+                Clock.now += 1
+                return Clock.now
+
+        nx_graph = get_nx_graphs_100()[0]
+        clock = tree_module.time
+        tree_module.time = Clock()
+        try:
+            tree = RoutingTree(nx_graph, rank_greedy, max_time=100000)
+            tree.build(13, 5, 3, 0.29, horizon=6)
+            seconds = tree.get_build_stats()['seconds']
+            self.assertTrue(seconds > 0)
+            # the time between builds does not count, the extensions add up
+            Clock.now += 1000
+            tree.extend()
+            self.assertTrue(seconds < tree.get_build_stats()['seconds'] < 1000)
+
+            budget_tree = RoutingTree(nx_graph, rank_greedy, max_time=seconds + 1)
+            budget_tree.build(13, 5, 3, 0.29, horizon=6)
+            self.assertFalse(budget_tree.is_partial())
+            budget_tree.extend()
+            self.assertTrue(budget_tree.is_partial())
+        finally:
+            tree_module.time = clock
+
+    def test_pruning(self):
+        for nx_graph, args in [(get_nx_graphs_100()[0], (13, 5, 6, 0.29)),
+                               (get_nx_graphs_100_structured()[0], (105, 104, 8, .05))]:
+            tree = RoutingTree(nx_graph, rank_greedy, prune=False)
+            tree.build(*args)
+            pruned_tree = RoutingTree(nx_graph, rank_greedy)
+            pruned_tree.build(*args)
+
+            self.assertTrue(pruned_tree.get_height() == tree.get_height())
+            self.assertTrue(pruned_tree.get_build_stats()['nodes'] <=
+                            tree.get_build_stats()['nodes'])
+            self.assertTrue(pruned_tree.get_sender_set_rank() == tree.get_sender_set_rank())
+            self.assertTrue(pruned_tree.get_sender_set_distribution(
+                pruned_tree.distro_rank_exponetial_backoff) ==
+                            tree.get_sender_set_distribution(tree.distro_rank_exponetial_backoff))
+
+    def test_sender_set_cache(self):
+        nx_graph = get_nx_graphs_100()[0]
+        without_adversary = nx_graph.copy()
+        without_adversary.remove_node(13)
+        for graph in [nx_graph, CompactGraph.from_nx_graph(nx_graph)]:
+            cache = SenderSetCache(graph)
+            for hop in [3, 1, 2, 6, 5]:
+                nodes = cache.get_sender_set(13, 5, hop)
+                expected = nx.single_source_shortest_path_length(
+                    without_adversary, 5, cutoff=hop - 1)
+                self.assertTrue(nodes.tolist() == sorted(expected.keys()))
+            self.assertTrue(cache.hits > 0)
+
+        tree = RoutingTree(cache.graph, rank_greedy, sender_set_cache=cache)
+        tree.build(13, 5, 4, 0.29)
+        self.assertTrue(tree.get_sender_set() == cache.get_sender_set(13, 5, 4).tolist())
+
+        pairs = [(13, 5), (5, 13)] + list(nx_graph.edges())[:20]
+        # each pair is searched up to its largest hop
+        interceptions = [pair + (index % 6 + 1,) for index, pair in enumerate(pairs)]
+        interceptions.append((13, 5, 6))
+        max_hops = dict((pair, hop) for pair, hop in [(i[:2], i[2]) for i in interceptions])
+        prefetched = SenderSetCache(cache.graph)
+        prefetched.prefetch(interceptions, batch_size=8)
+        self.assertTrue(len(prefetched) == sum(max_hops.values()))
+        for (adversary_id, previous_id), max_hop in max_hops.items():
+            for hop in range(1, max_hop + 1):
+                nodes = prefetched.get_sender_set(adversary_id, previous_id, hop)
+                self.assertTrue(nodes.tolist() == cache.get_sender_set(
+                    adversary_id, previous_id, hop).tolist())
+            # later hops extend the prefetched frontier
+            self.assertTrue(prefetched.get_sender_set(adversary_id, previous_id, 7).tolist() ==
+                            cache.get_sender_set(adversary_id, previous_id, 7).tolist())
+        self.assertTrue(prefetched.misses == sum(7 - hop for hop in max_hops.values()))
+
+        # the cache size counts the node ids of the sender sets
+        bounded = SenderSetCache(cache.graph, max_size=300)
+        for hop in range(1, 8):
+            bounded.get_sender_set(13, 5, hop)
+            self.assertTrue(bounded.get_sender_set(13, 5, hop).tolist() ==
+                            cache.get_sender_set(13, 5, hop).tolist())
+            self.assertTrue(sum(len(nodes) + len(frontier) for nodes, frontier in
+                                bounded._entries.values()) <= 300)
+        self.assertTrue(len(bounded) < 7)
+
+    def test_distance_matrix(self):
+        nx_graph = get_nx_graphs_100()[0]
+        compact = CompactGraph.from_nx_graph(nx_graph)
+        matrix = DistanceMatrix.build(compact, batch_size=7)
+        for node_id, lengths in nx.all_pairs_shortest_path_length(nx_graph):
+            for other_id, length in lengths.items():
+                self.assertTrue(matrix.distances[node_id, other_id] == length)
+
+        searched = SenderSetCache(compact)
+        cache = SenderSetCache(compact, distances=matrix)
+        for adversary_id, previous_id in [(13, 5), (5, 13), (0, 1), (57, 5)] + \
+                list(nx_graph.edges())[:40]:
+            for hop in range(0, 8):
+                self.assertTrue(cache.get_sender_set(adversary_id, previous_id, hop).tolist() ==
+                                searched.get_sender_set(adversary_id, previous_id, hop).tolist())
+
+    def test_encoded(self):
+        nx_graph = get_nx_graphs_100()[0]
+        for prune in [True, False]:
+            for hop in range(1, 6):
+                tree = RoutingTree(nx_graph, rank_greedy, prune=prune)
+                tree.build(13, 5, hop, 0.29)
+                encoded = tree.to_encoded()
+                self.assertTrue(encoded_to_bracket(encoded) == tree.to_bracket())
+                node_ids, parent_offsets, _ = decode_tree(encoded)
+                self.assertTrue(node_ids[:2].tolist() == [13, 5])
+                self.assertTrue(parent_offsets[0] == 0 and (parent_offsets[1:] > 0).all())
+        self.assertTrue(RoutingTree(nx_graph, rank_greedy).to_encoded() == '')
+        self.assertTrue(encoded_to_bracket('') == '')
+
+    def test_extend(self):
+        nx_graph = get_nx_graphs_100()[0]
+        tree = RoutingTree(nx_graph, rank_greedy)
+        tree.build(13, 5, 1, 0.29, horizon=7)
+        for hop in range(2, 8):
+            self.assertTrue(tree.extend())
+            self.assertTrue(tree.get_max_hop() == hop)
+            fresh_tree = RoutingTree(nx_graph, rank_greedy)
+            fresh_tree.build(13, 5, hop, 0.29)
+            self.assertTrue(tree.to_bracket() == fresh_tree.to_bracket())
+            self.assertTrue(tree.get_sender_set() == fresh_tree.get_sender_set())
+            self.assertTrue(tree.get_sender_set_rank() == fresh_tree.get_sender_set_rank())
+            self.assertTrue(tree.get_sender_set_distribution(tree.distro_rank_exponetial_backoff) ==
+                            fresh_tree.get_sender_set_distribution(
+                                fresh_tree.distro_rank_exponetial_backoff))
+        with self.assertRaises(Exception):
+            tree.extend()
+
+    def test_estimator(self):
+        nx_graph = get_nx_graphs_100()[0]
+        compact = CompactGraph.from_nx_graph(nx_graph)
+        ranks = rank_table(compact, 0.29)
+        for hop in range(1, 5):
+            tree = RoutingTree(compact, rank_greedy)
+            tree.build(13, 5, hop, 0.29)
+            sender_set = tree.get_sender_set()
+            # without randomness only first choice paths reach the previous node
+            estimated = estimate_sender_distribution(
+                compact, ranks, 13, 5, hop, sender_set, 0.0, 20, numpy.random.RandomState(1))
+            self.assertTrue(sorted(estimated.keys()) == sender_set)
+            self.assertTrue(abs(sum(estimated.values()) - 1.0) < 1e-9)
+            ranked = tree.get_sender_set_rank()
+            if hop < 4:
+                top_rank = sorted(ranked.keys())[0]
+                self.assertTrue(sorted(i for i in sender_set if estimated[i] > 0) ==
+                                sorted(ranked[top_rank]))
+            else:
+                # no first choice path, every sender is equally likely
+                self.assertTrue(len(set(estimated.values())) == 1)
+
+            randomized = estimate_sender_distribution(
+                compact, ranks, 13, 5, hop, sender_set, 0.1, 50, numpy.random.RandomState(1))
+            self.assertTrue(abs(sum(randomized.values()) - 1.0) < 1e-9)
+
+    def test_markov_chain(self):
+        nx_graph = get_nx_graphs_100()[0]
+        compact = CompactGraph.from_nx_graph(nx_graph)
+        transitions = transition_matrix(compact, rank_table(compact, 0.29),
+                                        lambda rank: 1.0 / (2 ** rank))
+        self.assertTrue(numpy.allclose(transitions.sum(axis=1), 1.0))
+
+        def walk_probability(node_id, steps):
+            # sum over every walk of steps hops ending at the previous node
+            if steps == 0:
+                return 1.0 if node_id == 5 else 0.0
+            return sum(transitions[node_id, i] * walk_probability(i, steps - 1)
+                       for i in compact.neighbors(node_id) if i != 13)
+
+        for hop in range(1, 4):
+            sender_set = SenderSetCache(compact).get_sender_set(13, 5, hop).tolist()
+            distro = sender_distribution_markov(transitions, 13, 5, hop, sender_set)
+            expected = dict((i, walk_probability(i, hop - 1)) for i in sender_set)
+            total = sum(expected.values())
+            self.assertTrue(sorted(distro.keys()) == sender_set)
+            for node_id in sender_set:
+                self.assertTrue(abs(distro[node_id] - expected[node_id] / total) < 1e-9)
+
     def test_out_of_bounds(self):
         nx_graph = get_nx_graphs()[0]
         tree = RoutingTree(nx_graph, None)
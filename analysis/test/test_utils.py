@@ -7,7 +7,7 @@ Unit test for routing tree
 '''
 import unittest
 
-from lib.utils import distance
+from lib.utils import distance, anonymity_set_calculated
 
 
 class TestUtilities(unittest.TestCase):
@@ -21,3 +21,12 @@ class TestUtilities(unittest.TestCase):
         d_2 = distance(0.11, 0.05)
         self.assertTrue(d_1 == 0.06)
         self.assertTrue(d_2 == d_1)
+
+    def test_anonymity_set_calculated(self):
+        self.assertFalse(anonymity_set_calculated({}))
+        self.assertFalse(anonymity_set_calculated({'anonymity_set': {'calculated': False}}))
+        complete = {'anonymity_set': {'calculated': True}}
+        partial = {'anonymity_set': {'calculated': True, 'partial': True}}
+        self.assertTrue(anonymity_set_calculated(complete, False))
+        self.assertFalse(anonymity_set_calculated(partial))
+        self.assertTrue(anonymity_set_calculated(partial, True))
@@ -21,20 +21,30 @@ def get_nx_graphs_100():
     '''
     Get the test network graph
     '''
-    current_dir = os.path.dirname(__file__)
-    graph_file = os.path.join(current_dir, 'resources', 'size_100.gml')
-    nx_graph = nx.read_gml(graph_file, 'id')
+    nx_graph = nx.read_gml(get_gml_path_100(), 'id')
     return {0: nx_graph}
 
+def get_gml_path_100():
+    '''
+    Get the test network graph file path
+    '''
+    current_dir = os.path.dirname(__file__)
+    return os.path.join(current_dir, 'resources', 'size_100.gml')
+
 def get_nx_graphs_100_structured():
     '''
     Get the test network graph
     '''
-    current_dir = os.path.dirname(__file__)
-    graph_file = os.path.join(current_dir, 'resources', 'size_100_structured.gml')
-    nx_graph = nx.read_gml(graph_file, 'id')
+    nx_graph = nx.read_gml(get_gml_path_100_structured(), 'id')
     return {0: nx_graph}
 
+def get_gml_path_100_structured():
+    '''
+    Get the test network graph file path, its node ids are 100 to 199
+    '''
+    current_dir = os.path.dirname(__file__)
+    return os.path.join(current_dir, 'resources', 'size_100_structured.gml')
+
 def get_route_json_path_100():
     '''
     Get the test routing data file path
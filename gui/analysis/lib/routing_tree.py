@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+'''
+Updated on March, 2018
+@author: Todd Baumeister <tbaumeist@gmail.com>
+
+Render the compact routing tree encoding of the sender set calculator
+'''
+import os
+import sys
+
+# share the tree decoder of the analysis tool next to the gui
+ANALYSIS_DIRECTORY = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..', '..', '..', 'analysis'))
+if ANALYSIS_DIRECTORY not in sys.path:
+    sys.path.append(ANALYSIS_DIRECTORY)
+
+from lib.routing.tree_encoding import encoded_to_bracket  # noqa: E402
+
+
+class RoutingTreeUtil(object):
+    '''
+    Utility for converting encoded routing trees to the bracket format
+    '''
+
+    @staticmethod
+    def to_bracket(encoded):
+        '''
+        Return the bracket string of an encoded routing tree, see
+        lib/routing/tree_encoding.py of the analysis tool for the encoding
+        '''
+        return encoded_to_bracket(encoded)
@@ -11,6 +11,7 @@ import zipfile
 import jmespath
 from flask_restful import Resource
 from flask import jsonify, current_app, request
+from analysis.lib.routing_tree import RoutingTreeUtil
 
 
 class Data(Resource):
@@ -54,9 +55,16 @@ class Data(Resource):
         count = 0
         for line in c_file:
             r_json = json.loads(line)
+            # render the tree first so filters see the bracket string
+            self._render_tree(r_json)
             if expression is None or expression.search(r_json):
                 routes.append(r_json)
                 count += 1
                 if count >= 100:
                     break
-        
+
+    def _render_tree(self, r_json):
+        # trees are stored encoded
+        a_set = r_json.get('anonymity_set')
+        if a_set is not None and 'tree_encoded' in a_set:
+            a_set['tree'] = RoutingTreeUtil.to_bracket(a_set.pop('tree_encoded'))